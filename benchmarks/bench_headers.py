@@ -0,0 +1,114 @@
+"""Benchmark of parsing adversarial media types.
+
+Compares the single pass tokenizer behind MimeType.parse and MimeParameters
+with the regular expressions it replaces, on media types built to make those
+expressions work hard: subtypes full of slashes, quoted parameter values made
+of escaped quotes, and long lists of parameters. Only the first makes the
+old expressions backtrack; on the others both take linear time, and the
+tokenizer, scanning in Python, pays a constant factor for its guarantee. Run
+from the repository root as `python -m benchmarks.bench_headers`.
+
+"""
+
+import re
+import timeit
+
+import eupheme.mime as mime
+
+
+# The regular expressions previously used to split a media type, to split a
+# parameter and to match a quoted parameter value.
+RE_MIMETYPE = re.compile(r'^(?P<type>.+)/'
+                         r'(?P<subtype>.+?)'
+                         r'(?P<parameters>;.*)?$')
+
+RE_PARAMETER = re.compile(r'^(?P<key>\w+)=(?P<value>.*)$', re.DOTALL)
+
+RE_QUOTED_STRING = re.compile(
+    r'^"('
+    r'[^\\\"\r\x80-\xff]|' '\r\n|'
+    r'\\[\x00-\x7f]'
+    r')*"$'
+)
+
+RE_TOKEN = re.compile(r'^[^\x00-\x20\x80-\xff()<>@,;:\\"/\[\]?=]+$')
+
+
+def slashes(length):
+    """
+    A media type whose subtype is 'length' slashes apart, followed by a line
+    break. The type is valid, so parsing gets past it; the old expression
+    tries to split the rest at every slash before giving up.
+    """
+
+    return 'a' + '/a' * length + '\nx'
+
+
+def escapes(length):
+    """A quoted parameter value of 'length' escaped quotes."""
+
+    return 'text/plain; p="' + '\\"' * length + '"'
+
+
+def pairs(length):
+    """A media type with 'length' parameters."""
+
+    return 'text/plain' + ''.join(
+        '; k{0}=v{0}'.format(i) for i in range(length)
+    )
+
+
+def regex(encoded):
+    """Parses 'encoded' the way MimeType.parse used to."""
+
+    match = RE_MIMETYPE.match(encoded)
+    if match is None or match.group('parameters') is None:
+        return
+
+    for parameter in match.group('parameters').split(';'):
+        parameter = parameter.strip()
+        if not parameter:
+            continue
+
+        match = RE_PARAMETER.match(parameter)
+        if match is None:
+            return
+
+        value = match.group('value')
+        if not RE_TOKEN.match(value) and RE_QUOTED_STRING.match(value):
+            re.sub(r'\\(.)', r'\1', value[1:-1])
+
+
+def tokenize(encoded):
+    """Parses 'encoded' with the tokenizer, bypassing the intern table."""
+
+    mime.MimeType.interned.clear()
+    try:
+        mime.MimeType.parse(encoded)
+    except ValueError:
+        pass
+
+
+def main():
+    number = 20
+
+    # Lift the limits, so the tokenizer gets to see the whole input.
+    mime.MimeType.max_length = float('inf')
+    mime.MimeParameters.max_parameters = float('inf')
+
+    print('{0:>8} {1:>8} {2:>14} {3:>14}'.format(
+        'input', 'length', 'regex (ms)', 'tokenizer (ms)'))
+    for build in (slashes, escapes, pairs):
+        for length in (250, 500, 1000, 2000, 4000):
+            encoded = build(length)
+
+            old = timeit.timeit(lambda: regex(encoded), number=number)
+            new = timeit.timeit(lambda: tokenize(encoded), number=number)
+
+            print('{0:>8} {1:>8} {2:>14.3f} {3:>14.3f}'.format(
+                build.__name__, length, old / number * 1e3,
+                new / number * 1e3))
+
+
+if __name__ == '__main__':
+    main()
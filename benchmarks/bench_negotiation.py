@@ -0,0 +1,72 @@
+"""Benchmark of media range matching against the length of Accept headers.
+
+Compares picking the best offer through a RangeIndex with the linear scan over
+all requested ranges it replaces, for Accept headers of increasing length.
+Run from the repository root as `python -m benchmarks.bench_negotiation`.
+
+"""
+
+import timeit
+
+import eupheme.mime as mime
+import eupheme.negotiation as negotiation
+
+
+# Offers as an endpoint producing a few common formats would make.
+OFFERS = [
+    mime.MimeType('text', 'html'),
+    mime.MimeType('application', 'json'),
+    mime.MimeType('application', 'xml'),
+    mime.MimeType('text', 'plain'),
+]
+
+
+def accept_header(length):
+    """Builds an Accept header of 'length' ranges, crawler style."""
+
+    ranges = ['application/x-type{0};q=0.{1}'.format(i, i % 9 + 1)
+              for i in range(length - 2)]
+    ranges += ['text/*;q=0.5', '*/*;q=0.1']
+    return ', '.join(ranges)
+
+
+def linear_best_offer(requested, offered):
+    """The best offer, scanning all requested ranges for every offer."""
+
+    best = None
+    best_quality = None
+    for offer in offered:
+        try:
+            match = max(req for req in requested if offer in req)
+        except ValueError:
+            continue
+        if best is None or best_quality < match.quality:
+            best, best_quality = offer, match.quality
+    return best
+
+
+def main():
+    broker = negotiation.Broker(None, None, None, None)
+    number = 2000
+
+    print('{0:>8} {1:>14} {2:>14}'.format(
+        'ranges', 'linear (us)', 'index (us)'))
+    for length in (2, 5, 10, 20, 50, 100):
+        requested = [mime.MimeType.parse(r.strip())
+                     for r in accept_header(length).split(',')]
+        index = negotiation.RangeIndex(requested)
+
+        assert linear_best_offer(requested, OFFERS) == \
+            broker.best_offer(index, OFFERS)
+
+        linear = timeit.timeit(
+            lambda: linear_best_offer(requested, OFFERS), number=number)
+        indexed = timeit.timeit(
+            lambda: broker.best_offer(index, OFFERS), number=number)
+
+        print('{0:>8} {1:>14.2f} {2:>14.2f}'.format(
+            length, linear / number * 1e6, indexed / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
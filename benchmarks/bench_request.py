@@ -0,0 +1,56 @@
+"""Benchmark of creating requests with and without parsing their headers.
+
+A request turned down early, for example with a 404, only needs its method and
+path. This compares creating such a request with creating one and touching
+everything that used to be parsed up front: Accept, Accept-Charset, cookies,
+Content-Length and the query string. Run from the repository root as
+`python -m benchmarks.bench_request`.
+
+"""
+
+import io
+import timeit
+
+import eupheme.request as request
+
+
+ENVIRON = {
+    'REQUEST_METHOD': 'GET',
+    'PATH_INFO': '/articles/1234',
+    'QUERY_STRING': 'page=2&sort=date&tag=a&tag=b',
+    'CONTENT_LENGTH': '',
+    'HTTP_ACCEPT': 'text/html,application/xhtml+xml,application/xml;q=0.9,'
+                   '*/*;q=0.8',
+    'HTTP_ACCEPT_CHARSET': 'utf-8, iso-8859-1;q=0.5',
+    'HTTP_COOKIE': 'session=0123456789abcdef; theme=dark; lang=en',
+    'wsgi.input': io.BytesIO(),
+}
+
+
+def untouched():
+    """Creates a request, using only what routing needs."""
+
+    req = request.Request(ENVIRON, None)
+    return req.method, req.path
+
+
+def touched():
+    """Creates a request and uses everything that used to be eager."""
+
+    req = request.Request(ENVIRON, None)
+    return (req.method, req.path, req.accept, req.accept_charset,
+            req.cookies, req.content_length, req.query)
+
+
+def main():
+    number = 20000
+
+    for name, function in (('path only', untouched),
+                           ('everything', touched)):
+        elapsed = timeit.timeit(function, number=number)
+        print('{0:>12} {1:>10.2f} us/request'.format(
+            name, elapsed / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,11 @@
+import codecs
+import hashlib
+import os
+
 import logbook
 
+import eupheme.cache as cache
+import eupheme.compression as compression
 import eupheme.faucets as faucets
 import eupheme.request as request
 import eupheme.response as response
@@ -20,24 +26,53 @@ class Application:
     An instance of this class is a valid WSGI callable as specified in PEP3333.
     """
 
+    # The size of the blocks binary files are served in.
+    block_size = 64 * 1024
+
     def __init__(self, path=None):
         """
         Instantiates a new application, with empty routing and faucet tables.
         """
 
-        self.routes = routing.RouteManager()
-        self.faucets = faucets.FaucetManager()
-
         conf = config.load(path)
 
+        self.routes = routing.RouteManager(conf.routes.cache_size)
+        self.faucets = faucets.FaucetManager()
+
         faucets.FormFaucet.default_charset = \
             conf.default.charset.codec.name
+        faucets.FormFaucet.max_fields = conf.limits.form_fields
+        faucets.FormFaucet.max_field_length = conf.limits.form_field_length
+        faucets.MultipartFaucet.max_parts = conf.limits.form_fields
+
+        request.Request.max_header_length = conf.limits.header_length
+        mime.MimeParameters.max_parameters = conf.limits.parameters
+
+        # Content codings are only negotiated if there are any to offer
+        # besides the identity coding.
+        codings = conf.compression.codings
+        if codings:
+            codings = codings + [compression.IDENTITY]
 
         self.broker = negotiation.Broker(
             charsets=conf.charsets,
             default_charset=conf.default.charset,
             methods=conf.methods,
-            default_mimetype=conf.default.mimetype
+            default_mimetype=conf.default.mimetype,
+            codings=codings
+        )
+
+        self.compressor = compression.Compressor(
+            conf.compression.mimetypes,
+            conf.compression.min_length,
+            conf.compression.levels
+        )
+
+        # Responses of endpoints that are cached, by their path, query string
+        # and representation.
+        self.responses = cache.ExpiringCache(
+            conf.responses.cache_size,
+            conf.responses.max_bytes
         )
 
         if hasattr(conf, 'cookies') and hasattr(conf.cookies, 'key'):
@@ -46,6 +81,32 @@ class Application:
 
         self.logger = logbook.Logger('Application')
 
+    def endpoints(self):
+        """Yields the endpoints of all resources routed to."""
+
+        for route in self.routes.routes:
+            for method in route.resource.allowed_methods:
+                endpoint = getattr(route.resource, method.lower(), None)
+                if endpoint is not None:
+                    yield endpoint
+
+    def prepare(self):
+        """
+        Readies the application for serving once all routes and faucets are
+        added. Compiles the routing table and has the outgoing faucets preload
+        what the endpoints need, such as their templates. Calling this is
+        optional; without it, the work is done by the first requests.
+        """
+
+        self.routes.freeze()
+
+        endpoints = list(self.endpoints())
+        prepared = []
+        for faucet in self.faucets.faucets_outgoing.values():
+            if not any(faucet is other for other in prepared):
+                faucet.preload(endpoints)
+                prepared.append(faucet)
+
     def __call__(self, environ, start_response):
         """
         Handles an incoming WSGI request; c.f. PEP3333 for parameter details.
@@ -62,21 +123,58 @@ class Application:
             # Obtain the endpoint that handles the method for this resource.
             endpoint = self.broker.negotiate_endpoint(req.method, resource)
 
-            # Pick a character set that we will use for the output
-            charset = self.broker.negotiate_charset(req.accept_charset)
+            # Choose the content type and character set to be used for the
+            # output. Both depend on request headers listed in Vary. Raw
+            # endpoints choose their representation themselves.
+            negotiated = None
+            vary = []
+            variant = ()
+            if not getattr(endpoint, 'raw', False):
+                negotiated = self.broker.negotiate(req, endpoint)
+                mimetype = negotiated.mimetype
+                charset = negotiated.charset
+                vary = negotiated.vary
+
+                # Only some types of output are compressed; whether any other
+                # type is does not depend on the Accept-Encoding header.
+                coding = negotiated.coding
+                if coding is None or not self.compressor.compresses(mimetype):
+                    coding = compression.IDENTITY
+                    vary = [name for name in vary if name != 'Accept-Encoding']
+
+                variant = (str(mimetype), charset.codec.name, coding.name)
 
-            # Choose the content type to be used for the output
-            mimetype = self.broker.negotiate_output(req, endpoint)
+            # Cached responses are served as they are, without calling on the
+            # endpoint at all.
+            key = None
+            if getattr(endpoint, 'cache_ttl', None) is not None and \
+                    req.method in ('GET', 'HEAD'):
+                key = (req.method, req.path, req.query_string) + variant
+                entry = self.cached_response(key, req)
+                if entry is not None:
+                    return self.serve_cached(entry, req, start_response)
 
-            # Gather the input for this request, if there is any.
-            data = self.broker.negotiate_input(req, endpoint)
+            # Endpoints validated by a version key may be spared rendering a
+            # representation the client already has.
+            etag = None
+            validated = getattr(endpoint, 'etag', False) and \
+                req.method in ('GET', 'HEAD')
+            if validated and endpoint.etag_version is not None:
+                etag = self.version_etag(endpoint, args, req, variant)
+                if etag is not None and req.etag_matches(etag):
+                    raise self.not_modified(etag, vary)
 
             # If there is an entity included in this request, run it through
-            # the appropriate faucet for this endpoint.
-            if data is not None:
+            # the appropriate faucet for this endpoint. The faucet decides how
+            # much of the entity is read, and how.
+            data = None
+            consumed = self.broker.negotiate_input(req, endpoint)
+            if consumed is not None:
+                data = self.faucets.read_incoming(consumed, req)
                 data = self.faucets.process_incoming(
-                    req.content_type,
-                    faucets.Flow(faucets.Flow.IN, data)
+                    consumed,
+                    faucets.Flow(faucets.Flow.IN, data, endpoint=endpoint,
+                                 mimetype=req.mimetype)
                 )
 
             # Call on the endpoint to do the actual data processing.
@@ -89,25 +187,328 @@ class Application:
             if not isinstance(result, response.Response):
                 result = response.Response(result)
 
-            # Run the produced data through a faucet for the outgoing mimetype.
-            output = self.faucets.process_outgoing(
-                mimetype,
-                faucets.Flow(faucets.Flow.OUT, result.data, endpoint=endpoint)
-            )
+            if negotiated is None:
+                # Raw endpoints produce binary data, served as is with the
+                # mime type they set on the response.
+                output = result.data
+                mimetype = result.mimetype
+                if not self.binary(output):
+                    raise response.HttpInternalServerErrorException()
+            else:
+                # Run the produced data through a faucet for the outgoing
+                # mimetype.
+                output = self.faucets.process_outgoing(
+                    mimetype,
+                    faucets.Flow(faucets.Flow.OUT, result.data,
+                                 endpoint=endpoint)
+                )
+
+            if self.binary(output):
+                # Binary output is served as is, so it has no charset. Its
+                # length is known up front, at least for buffers.
+                length = self.content_length(output)
+                if length is not None and negotiated is None:
+                    # Raw endpoints may leave out the body their length
+                    # describes, as they do for HEAD requests.
+                    result.headers.setdefault('Content-Length', str(length))
+                elif length is not None:
+                    # Faucet output replaces whatever the endpoint produced.
+                    result.headers['Content-Length'] = str(length)
+
+                body = self.passthrough(output, environ)
+            else:
+                # Synthesize the negotiated mimetype and charset
+                mimetype = mime.MimeType(
+                    mimetype.type,
+                    mimetype.subtype,
+                    charset=charset.codec.name
+                )
 
-            # Synthesize the negotiated mimetype and charset
-            mimetype = mime.MimeType(
-                mimetype.type,
-                mimetype.subtype,
-                charset=charset.codec.name
-            )
+                body = self.encode_body(output, charset, coding,
+                                        result.headers)
+
+            # Without a version key, the tag is known once the body is, as
+            # long as it is rendered in full.
+            if validated and etag is None and isinstance(body, list):
+                etag = self.body_etag(body, endpoint.etag_weak)
+                if req.etag_matches(etag):
+                    raise self.not_modified(etag, vary, result.headers)
+
+            if etag is not None:
+                result.headers.setdefault('ETag', etag)
 
             # We made it! Spit out the actual response.
             result.mimetype = mimetype
+            if vary:
+                result.headers.setdefault('Vary', ', '.join(vary))
             result.serve(start_response)
-            encoded, length = charset.codec.encode(output)
-            yield encoded
+
+            if key is not None and isinstance(body, list):
+                self.cache_response(key, req, result, body, endpoint.cache_ttl)
 
         except response.HttpException as e:
             # An error occured which we can report to the user.
             e.as_response().serve(start_response)
+            return []
+
+        # The headers are out; errors from here on can no longer be reported
+        # as a response of their own.
+        return body
+
+    def version_etag(self, endpoint, args, req, variant):
+        """
+        Returns the entity tag for the response of 'endpoint' to the request
+        'req', given the arguments 'args', based on the version key of the
+        endpoint and the tuple 'variant' describing the representation that
+        was negotiated. Returns None if the endpoint cannot tell its version.
+        """
+
+        version = endpoint.etag_version
+
+        # Version keys of resource endpoints take the resource like they do.
+        if hasattr(endpoint, '__self__'):
+            version = version.__get__(endpoint.__self__)
+
+        key = version(*args, request=req)
+        if key is None:
+            return None
+
+        # Every representation of a version has a tag of its own.
+        key = repr((key,) + variant).encode('utf-8')
+        return self.etag(key, endpoint.etag_weak)
+
+    def body_etag(self, body, weak):
+        """
+        Returns the entity tag for the body 'body', a list of bytes, which is
+        weak if 'weak' is True.
+        """
+
+        return self.etag(b''.join(body), weak)
+
+    def etag(self, data, weak):
+        """
+        Returns an entity tag hashed from the bytes 'data', which is weak if
+        'weak' is True.
+        """
+
+        tag = '"{0}"'.format(hashlib.blake2b(data, digest_size=16).hexdigest())
+        return 'W/' + tag if weak else tag
+
+    def not_modified(self, etag, vary, headers=None):
+        """
+        Returns the HttpNotModifiedException for a representation tagged
+        'etag', varying on the request headers 'vary'. The headers among
+        'headers' that a 304 response has to repeat are included as well.
+        """
+
+        # The headers a 200 response would have had, as far as they tell
+        # caches what to do with the representation -- RFC7232 section 4.1.
+        repeated = {'ETag': etag}
+        if vary:
+            repeated['Vary'] = ', '.join(vary)
+
+        for name in ('Cache-Control', 'Content-Location', 'Expires'):
+            if headers and name in headers:
+                repeated[name] = headers[name]
+
+        return response.HttpNotModifiedException(repeated)
+
+    def cached_response(self, key, req):
+        """
+        Returns the cached response for 'key' if the request 'req' allows for
+        it to be served, or None.
+        """
+
+        directives = req.cache_control
+
+        # Either directive has the response rendered anew -- RFC7234 section
+        # 5.2.1. Stale responses are never served, whatever max-stale says.
+        if 'no-cache' in directives or 'no-store' in directives:
+            return None
+
+        entry = self.responses.get(key)
+        if entry is None:
+            return None
+
+        created, ttl, status, headers, body = entry
+        age = self.responses.clock() - created
+
+        try:
+            if 'max-age' in directives and \
+                    age > int(directives['max-age']):
+                return None
+
+            if 'min-fresh' in directives and \
+                    ttl - age < int(directives['min-fresh']):
+                return None
+        except (TypeError, ValueError):
+            return None  # Malformed ages are taken to rule the entry out.
+
+        return entry
+
+    def cache_response(self, key, req, result, body, ttl):
+        """
+        Stores the response 'result' to the request 'req', with the encoded
+        body 'body', for 'ttl' seconds under 'key', unless either of them
+        rules it out.
+        """
+
+        if result.status != response.STATUS_OK or \
+                'no-store' in req.cache_control or any(result.cookies):
+            return
+
+        # Responses meant for one client only are not shared with the rest.
+        directives = request.parse_cache_control(
+            result.headers.get('Cache-Control', '')
+        )
+        if 'no-store' in directives or 'private' in directives:
+            return
+
+        body = b''.join(body)
+        headers = dict(result.headers)
+        size = len(body) + sum(len(name) + len(value)
+                               for name, value in headers.items())
+
+        entry = (self.responses.clock(), ttl, result.status, headers, body)
+        self.responses.put(key, entry, size=size, ttl=ttl)
+
+    def serve_cached(self, entry, req, start_response):
+        """
+        Serves the cached response 'entry' to the request 'req' through the
+        WSGI callable 'start_response', and returns its body.
+        """
+
+        created, ttl, status, headers, body = entry
+
+        etag = headers.get('ETag')
+        if etag is not None and req.etag_matches(etag):
+            vary = headers['Vary'].split(', ') if 'Vary' in headers else []
+            raise self.not_modified(etag, vary, headers)
+
+        # Caches tell how long ago the response was rendered -- RFC7234
+        # section 5.1.
+        age = int(self.responses.clock() - created)
+        start_response(status, list(headers.items()) + [('Age', str(age))])
+        return [body]
+
+    def encode_body(self, output, charset, coding, headers):
+        """
+        Returns an iterable over the faucet output 'output' encoded using the
+        character set 'charset' and compressed in the content coding 'coding',
+        adding the headers that describe the body to 'headers'.
+        """
+
+        if isinstance(output, str):
+            # Output rendered in full is encoded and compressed right away,
+            # so its length is known and compression can be skipped where it
+            # would not pay off.
+            body, length = charset.codec.encode(output)
+            if coding.name != 'identity' and \
+                    len(body) >= self.compressor.min_length:
+                body = self.compressor.compress(body, coding)
+                headers['Content-Encoding'] = coding.name
+
+            # Any length the endpoint set is that of the body before it was
+            # encoded or compressed.
+            headers['Content-Length'] = str(len(body))
+            return [body]
+
+        # The length of encoded chunks is not known until they are sent.
+        headers.pop('Content-Length', None)
+
+        body = self.encode(output, charset)
+        if coding.name != 'identity':
+            body = self.compressor.stream(body, coding)
+            headers['Content-Encoding'] = coding.name
+
+        return body
+
+    def binary(self, output):
+        """
+        Returns a boolean indicating whether the faucet output 'output' is
+        binary data, either a buffer or a file object, rather than text.
+        """
+
+        return (isinstance(output, (bytes, bytearray, memoryview)) or
+                hasattr(output, 'read'))
+
+    def content_length(self, output):
+        """
+        Returns the length in bytes of the binary output 'output', or None
+        when it cannot be told without reading it.
+        """
+
+        if isinstance(output, memoryview):
+            return output.nbytes
+        elif isinstance(output, (bytes, bytearray)):
+            return len(output)
+
+        # Files are served from their current position to their end.
+        try:
+            if output.seekable():
+                position = output.tell()
+                end = output.seek(0, os.SEEK_END)
+                output.seek(position)
+                return end - position
+        except (AttributeError, OSError):
+            pass
+
+        return None
+
+    def passthrough(self, output, environ):
+        """
+        Returns an iterable over the binary output 'output' that is suitable
+        to be returned to the WSGI server, without copying where possible.
+        """
+
+        if isinstance(output, bytes):
+            return [output]
+        elif isinstance(output, (bytearray, memoryview)):
+            # PEP3333 requires the body to be made up of bytes.
+            return [bytes(output)]
+
+        # Let the server send files in its own, possibly much faster, way.
+        wrapper = environ.get('wsgi.file_wrapper')
+        if wrapper is not None:
+            return wrapper(output, self.block_size)
+
+        return self.read_blocks(output)
+
+    def read_blocks(self, output):
+        """
+        Yields the contents of the file object 'output' a block at a time,
+        closing it once it is exhausted.
+        """
+
+        try:
+            while True:
+                block = output.read(self.block_size)
+                if not block:
+                    return
+                yield block
+        finally:
+            output.close()
+
+    def encode(self, output, charset):
+        """
+        Encodes the iterable of strings 'output' using the character set
+        'charset' and yields the resulting bytes, one chunk at a time as the
+        strings are produced.
+        """
+
+        # An incremental encoder keeps state between chunks, for encodings
+        # such as UTF-16 that emit a byte order mark only once.
+        encoder = codecs.getincrementalencoder(charset.codec.name)()
+        try:
+            for chunk in output:
+                encoded = encoder.encode(chunk)
+                if encoded:
+                    yield encoded
+
+            encoded = encoder.encode('', final=True)
+            if encoded:
+                yield encoded
+        finally:
+            # Release whatever resources the producer of the output holds.
+            if hasattr(output, 'close'):
+                output.close()
@@ -0,0 +1,161 @@
+"""Caching module.
+
+This module contains bounded caches that evict their least recently used
+entries. They are used to memoize work that repeats across requests, such as
+route lookups, and keep count of their hits and misses so they can be sized.
+
+"""
+
+import collections
+import threading
+import time
+
+
+class LruCache:
+
+    """A bounded mapping evicting its least recently used entries.
+
+    Lookups and insertions are guarded by a lock, as WSGI servers may call an
+    application from several threads at once.
+
+    """
+
+    def __init__(self, size):
+        """Create a new cache holding at most 'size' entries."""
+
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """ Look up the entry for 'key'.
+
+        Marks the entry as most recently used and counts a hit when it is
+        present, counts a miss and returns 'default' when it is not.
+
+        """
+
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """ Store 'value' for 'key'.
+
+        Evicts the least recently used entry when the cache grows beyond its
+        size. A cache of size zero stores nothing.
+
+        """
+
+        if self.size <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries, leaving the hit and miss counters intact."""
+
+        with self.lock:
+            self.entries.clear()
+
+
+class ExpiringCache(LruCache):
+
+    """A least recently used cache bounded by the total size of its values.
+
+    Besides a maximum number of entries, the cache holds values up to a total
+    number of bytes, as given for each value when it is stored. Entries may
+    also be given a time to live, after which they are no longer returned.
+
+    """
+
+    def __init__(self, size, max_bytes, clock=time.monotonic):
+        """
+        Create a new cache holding at most 'size' entries and 'max_bytes'
+        bytes worth of values. Expiry is measured using the callable 'clock'.
+        """
+
+        super().__init__(size)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.clock = clock
+
+    def get(self, key, default=None):
+        """ Look up the unexpired entry for 'key'.
+
+        Marks the entry as most recently used and counts a hit when it is
+        present, counts a miss and returns 'default' when it is not. Expired
+        entries are dropped on sight.
+
+        """
+
+        with self.lock:
+            try:
+                value, expires, size = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires <= self.clock():
+                del self.entries[key]
+                self.bytes -= size
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=0, ttl=None):
+        """ Store 'value', being 'size' bytes large, for 'key'.
+
+        The entry expires after 'ttl' seconds if given. Least recently used
+        entries are evicted until the cache is within its bounds again. Values
+        larger than the cache as a whole are not stored at all.
+
+        """
+
+        if self.size <= 0 or size > self.max_bytes:
+            return
+
+        expires = None if ttl is None else self.clock() + ttl
+
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries[key][2]
+
+            self.entries[key] = (value, expires, size)
+            self.entries.move_to_end(key)
+            self.bytes += size
+
+            while (len(self.entries) > self.size or
+                   self.bytes > self.max_bytes):
+                _, entry = self.entries.popitem(last=False)
+                self.bytes -= entry[2]
+
+    def clear(self):
+        """Drop all entries, leaving the hit and miss counters intact."""
+
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
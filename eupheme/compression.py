@@ -0,0 +1,88 @@
+"""Module containing the compression of response bodies."""
+import zlib
+
+import eupheme.mime as mime
+
+
+# The codings of responses that are not compressed and of gzipped ones.
+IDENTITY = mime.ContentCoding('identity')
+GZIP = mime.ContentCoding('gzip')
+
+# The window size zlib is given for every content coding it can produce. The
+# deflate coding is the zlib format -- RFC2616 section 3.5.
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+class Compressor:
+    """Compresses encoded response bodies in a negotiated content coding.
+
+    Only bodies of the mime types in the allow list are compressed, and of
+    those only bodies rendered in full that are at least the minimum length.
+    Bodies produced in chunks are compressed chunk by chunk as they come in,
+    whatever their length, which is not known when the headers are sent.
+    Every chunk is flushed, so it reaches the client as soon as it would have
+    uncompressed.
+    """
+
+    def __init__(self, mimetypes, min_length=1024, levels=None):
+        """
+        Instantiates a compressor for bodies of the mime types 'mimetypes',
+        strings or MimeType instances, of at least 'min_length' bytes. The
+        dictionary 'levels' maps codings to the zlib compression level used
+        for them, the default level being used for those left out.
+        """
+
+        self.mimetypes = {
+            mime.MimeType.parse(str(mimetype)).essence
+            for mimetype in mimetypes
+        }
+        self.min_length = min_length
+        self.levels = levels or {}
+
+    def compresses(self, mimetype):
+        """
+        Returns a boolean indicating whether bodies of the mime type 'mimetype'
+        are compressed, provided they are long enough.
+        """
+
+        return mimetype.essence in self.mimetypes
+
+    def compressor(self, coding):
+        """Returns a zlib compressor for the content coding 'coding'."""
+
+        return zlib.compressobj(
+            self.levels.get(coding.name, zlib.Z_DEFAULT_COMPRESSION),
+            zlib.DEFLATED,
+            WBITS[coding.name]
+        )
+
+    def compress(self, body, coding):
+        """Returns the bytes 'body' compressed in the coding 'coding'."""
+
+        compressor = self.compressor(coding)
+        return compressor.compress(body) + compressor.flush()
+
+    def stream(self, chunks, coding):
+        """
+        Yields the iterable of bytes 'chunks' compressed in the content coding
+        'coding', compressing every chunk as it is produced.
+        """
+
+        compressor = self.compressor(coding)
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+
+                # A sync flush ends the compressed chunk on a byte boundary,
+                # so the client can decompress all of it right away.
+                yield compressor.compress(chunk) + \
+                    compressor.flush(zlib.Z_SYNC_FLUSH)
+
+            yield compressor.flush()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
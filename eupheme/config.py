@@ -20,11 +20,38 @@ class Config:
 
     defaults = {
         'charsets': {'utf-8', 'ascii'},
-        'methods': {'GET', 'POST', 'PUT'},
+        'methods': {'GET', 'HEAD', 'POST', 'PUT'},
         'default':
         {
             'mimetype': 'text/html',
             'charset': 'utf-8'
+        },
+        'routes':
+        {
+            'cache_size': 0
+        },
+        'responses':
+        {
+            'cache_size': 1024,
+            'max_bytes': 16 * 1024 * 1024
+        },
+        'limits':
+        {
+            'header_length': 8192,
+            'parameters': 32,
+            'form_fields': 1000,
+            'form_field_length': 1024 * 1024
+        },
+        'compression':
+        {
+            'codings': [],
+            'min_length': 1024,
+            'levels': {'gzip': 6, 'deflate': 6},
+            'mimetypes': [
+                'text/html', 'text/plain', 'text/css', 'text/csv',
+                'text/javascript', 'text/xml', 'application/javascript',
+                'application/json', 'application/xml', 'image/svg+xml'
+            ]
         }
     }
 
@@ -80,6 +107,38 @@ def _verify(data):
     assert len(data['methods']) > 0, \
         'Must support at least one method'
 
+    assert data['routes']['cache_size'] >= 0, \
+        'Route cache size cannot be negative'
+
+    assert data['responses']['cache_size'] >= 0, \
+        'Response cache size cannot be negative'
+
+    assert data['responses']['max_bytes'] >= 0, \
+        'Response cache byte limit cannot be negative'
+
+    assert data['limits']['header_length'] > 0, \
+        'Header length limit must be positive'
+
+    assert data['limits']['parameters'] > 0, \
+        'Parameter count limit must be positive'
+
+    assert data['limits']['form_fields'] > 0, \
+        'Form field count limit must be positive'
+
+    assert data['limits']['form_field_length'] > 0, \
+        'Form field length limit must be positive'
+
+    assert all(coding in ('gzip', 'deflate')
+               for coding in data['compression']['codings']), \
+        'Only the gzip and deflate codings are supported'
+
+    assert data['compression']['min_length'] >= 0, \
+        'Compression length threshold cannot be negative'
+
+    assert all(-1 <= level <= 9
+               for level in data['compression']['levels'].values()), \
+        'Compression levels must be between -1 and 9'
+
     # Make sure the default charset is in the list of supported charsets
     assert data['default']['charset'] in data['charsets'], \
         'Default charset has to be in the list of supported charsets'
@@ -105,6 +164,13 @@ def _objectify(data):
     conf.default.charset = mime.CharacterSet.parse(conf.default.charset)
     conf.default.mimetype = mime.MimeType.parse(conf.default.mimetype)
 
+    # Codings and levels are looked up by name, not accessed as attributes.
+    conf.compression.codings = [
+        mime.ContentCoding.parse(coding)
+        for coding in conf.compression.codings
+    ]
+    conf.compression.levels = dict(vars(conf.compression.levels))
+
     return conf
 
 
@@ -145,4 +211,31 @@ def _check_defaults(data):
     if 'methods' not in data:
         config['methods'] = defaults['methods']
 
+    if 'routes' not in data:
+        config['routes'] = dict(defaults['routes'])
+
+    if 'cache_size' not in config['routes']:
+        config['routes']['cache_size'] = defaults['routes']['cache_size']
+
+    if 'responses' not in data:
+        config['responses'] = dict(defaults['responses'])
+
+    for key in defaults['responses']:
+        if key not in config['responses']:
+            config['responses'][key] = defaults['responses'][key]
+
+    if 'limits' not in data:
+        config['limits'] = dict(defaults['limits'])
+
+    for key in defaults['limits']:
+        if key not in config['limits']:
+            config['limits'][key] = defaults['limits'][key]
+
+    if 'compression' not in data:
+        config['compression'] = dict(defaults['compression'])
+
+    for key in defaults['compression']:
+        if key not in config['compression']:
+            config['compression'][key] = defaults['compression'][key]
+
     return config
@@ -1,8 +1,15 @@
+import codecs
 import urllib.parse
 import jinja2
+import jinja2.ext
 import json
+import re
+import tempfile
+import time
 
+import eupheme.cache as cache
 import eupheme.mime as mime
+import eupheme.response as response
 
 
 def parse_strings(mimetypes):
@@ -36,6 +43,53 @@ def consumes(*mimetypes):
     return wrapper
 
 
+def raw(func):
+    """
+    Decorator that marks an endpoint as choosing its own representation. Raw
+    endpoints skip content negotiation and faucets; they return a response
+    with its mimetype set and binary data, which is served as is.
+    """
+
+    func.raw = True
+    return func
+
+
+def etag(version=None, weak=False):
+    """
+    Decorator that has the application send an ETag along with the responses
+    of an endpoint to GET and HEAD requests, and answer those with 304 Not
+    Modified when the client's copy matches. The tag is a hash of the encoded
+    body, unless the callable 'version' is given. That is called like the
+    endpoint, without its data, before the endpoint is; the key it returns is
+    hashed instead, and a matching tag skips the endpoint and faucet entirely.
+    Should it return None, the body is hashed after all. The tag is weak if
+    'weak' is True.
+    """
+
+    def wrapper(func):
+        func.etag = True
+        func.etag_version = version
+        func.etag_weak = weak
+        return func
+
+    return wrapper
+
+
+def cached(ttl):
+    """
+    Decorator that has the application cache the responses of an endpoint to
+    GET and HEAD requests for 'ttl' seconds. Responses are cached by path,
+    query string and the representation negotiated, so only endpoints whose
+    responses depend on nothing else should be cached.
+    """
+
+    def wrapper(func):
+        func.cache_ttl = ttl
+        return func
+
+    return wrapper
+
+
 def template(template):
     """Decorator that associates an endpoint with a template."""
 
@@ -55,13 +109,18 @@ class Flow:
     data = None
     direction = None
     endpoint = None
+    mimetype = None
 
-    def __init__(self, direction, data, endpoint=None):
-        """Instantiates a new flow object."""
+    def __init__(self, direction, data, endpoint=None, mimetype=None):
+        """
+        Instantiates a new flow object. For incoming data, 'mimetype' is the
+        mime type it was sent as, parameters such as its charset included.
+        """
 
         self.direction = direction
         self.data = data
         self.endpoint = endpoint
+        self.mimetype = mimetype
 
 
 class FaucetManager:
@@ -106,6 +165,14 @@ class FaucetManager:
 
         return self.faucets_incoming[mimetype].incoming(flow)
 
+    def read_incoming(self, mimetype, request):
+        """
+        Reads the entity of 'request' as the incoming faucet for 'mimetype'
+        would have it. Returns the data to be passed to that faucet.
+        """
+
+        return self.faucets_incoming[mimetype].read(request)
+
     def process_outgoing(self, mimetype, flow):
         """
         Processes an outgoing response by calling the appropriate faucet.
@@ -120,6 +187,18 @@ class IncomingFaucet:
 
     mimetypes = None
 
+    # The largest request body in bytes read for this faucet. Larger bodies
+    # are rejected before they are read.
+    max_length = None
+
+    def read(self, request):
+        """
+        Reads the entity of the request 'request' and returns it as the data
+        of the incoming flow. Reads the entity as a whole by default.
+        """
+
+        return request.read_entity(self.max_length)
+
     def incoming(self, flow):
         raise NotImplementedError
 
@@ -129,6 +208,14 @@ class OutgoingFaucet:
 
     mimetypes = None
 
+    def preload(self, endpoints):
+        """
+        Prepares the faucet for serving the endpoints in 'endpoints' before
+        the first request comes in. Does nothing by default.
+        """
+
+        pass
+
     def outgoing(self, flow):
         raise NotImplementedError
 
@@ -138,35 +225,570 @@ class FormFaucet(IncomingFaucet):
 
     default_charset = 'utf-8'
 
+    # The most fields parsed from a single form, and the longest field.
+    max_fields = 1000
+    max_field_length = 1024 * 1024
+
     mimetypes = {
         mime.MimeType('application', 'x-www-form-urlencoded')
     }
 
-    def sniff_charset(self, qs):
+    def split(self, qs):
         """
-        Decodes the query string and looks for an entry with the name
-        _charset_. If it finds it, that's the charset the form was sent in,
-        otherwise it returns None and lets the caller decide what charset
-        to use.
+        Splits the form data 'qs' into a list of pairs of its undecoded names
+        and values, leaving out fields without a value. Raises
+        HttpRequestEntityTooLargeException when there are too many fields or
+        when a field is too long.
+        """
+
+        fields = qs.split(b'&')
+        if len(fields) > self.max_fields:
+            raise response.HttpRequestEntityTooLargeException()
+
+        pairs = []
+        for field in fields:
+            if len(field) > self.max_field_length:
+                raise response.HttpRequestEntityTooLargeException()
+
+            name, equals, value = field.partition(b'=')
+            if value:
+                pairs.append((name, value))
+
+        return pairs
+
+    def sniff_charset(self, pairs):
+        """
+        Looks for an entry with the name _charset_ among the undecoded 'pairs'.
+        If it finds it, that's the charset the form was sent in, otherwise it
+        returns None and lets the caller decide what charset to use.
         """
 
         # For information on why we're doing this see:
         # http://www.w3.org/TR/html5/forms.html#url-encoded-form-data
+        for name, value in pairs:
+            if name == b'_charset_':
+                return self.unquote(value, 'ascii')
+
+        return None
+
+    def unquote(self, encoded, charset):
+        """
+        Decodes the percent-encoded bytes 'encoded' into a string using the
+        character set 'charset'.
+        """
+
+        if b'+' in encoded:
+            encoded = encoded.replace(b'+', b' ')
+        if b'%' in encoded:
+            encoded = urllib.parse.unquote_to_bytes(encoded)
 
-        # Decode the form data and drop any non-ascii values,then parse it.
-        querydata = qs.decode('ascii', 'ignore')
-        querystring = urllib.parse.parse_qs(querydata)
+        return encoded.decode(charset, 'replace')
 
-        # If _charset_ is found in the query string we return that, otherwise
-        # we'll just return None and let the caller decide what to do.
-        if '_charset_' in querystring:
-            return querystring['_charset_'][0]
+    def incoming(self, flow):
+        pairs = self.split(flow.data)
+
+        charset = self.sniff_charset(pairs) or self.default_charset
+        try:
+            charset = codecs.lookup(charset).name
+        except LookupError:
+            charset = self.default_charset
+
+        form = {}
+        for name, value in pairs:
+            form.setdefault(self.unquote(name, charset), []).append(
+                self.unquote(value, charset)
+            )
+
+        return form
+
+
+class JsonIncomingFaucet(IncomingFaucet):
+    """
+    Faucet that processes incoming JSON data. The data is parsed from the
+    request body as is, unless the charset parameter of its mime type calls
+    for decoding it first.
+    """
+
+    mimetypes = {
+        mime.MimeType('application', 'json')
+    }
+
+    # Strings as a whole, so their contents are skipped, and the delimiters
+    # opening and closing arrays and objects.
+    RE_NESTING = re.compile(
+        r'"(?:[^"\\]|\\.)*"|(?P<open>[\[{])|(?P<close>[\]}])'
+    )
+    RE_NESTING_BYTES = re.compile(RE_NESTING.pattern.encode('ascii'))
+
+    def __init__(self, max_length=1024 * 1024, max_depth=32):
+        """
+        Instantiates a faucet accepting documents of at most 'max_length'
+        bytes, with arrays and objects nested up to 'max_depth' levels deep.
+        """
+
+        self.max_length = max_length
+        self.max_depth = max_depth
+
+    def depth(self, document):
+        """
+        Returns the deepest level to which arrays and objects are nested in
+        the JSON string or bytes 'document'.
+        """
+
+        if isinstance(document, bytes):
+            pattern, brackets = self.RE_NESTING_BYTES, (b'[', b'{')
         else:
-            return None
+            pattern, brackets = self.RE_NESTING, ('[', '{')
+
+        # Documents without enough brackets cannot be nested too deeply.
+        opened = document.count(brackets[0]) + document.count(brackets[1])
+        if opened <= self.max_depth:
+            return opened
+
+        depth = deepest = 0
+        for match in pattern.finditer(document):
+            if match.lastgroup == 'open':
+                depth += 1
+                deepest = max(depth, deepest)
+            elif match.lastgroup == 'close':
+                depth -= 1
+
+        return deepest
 
     def incoming(self, flow):
-        charset = self.sniff_charset(flow.data) or FormFaucet.default_charset
-        return urllib.parse.parse_qs(flow.data.decode(charset))
+        document = flow.data
+
+        if self.max_length is not None and len(document) > self.max_length:
+            raise response.HttpRequestEntityTooLargeException()
+
+        parameters = flow.mimetype.parameters if flow.mimetype else {}
+        try:
+            if 'charset' in parameters:
+                encoding = codecs.lookup(parameters['charset']).name
+            else:
+                encoding = json.detect_encoding(document)
+        except LookupError:
+            # We cannot decode the charset -- RFC2616 section 10.4.16.
+            raise response.HttpUnsupportedMediaTypeException()
+
+        try:
+            # Bytes are parsed as UTF-8 by the decoder, anything else is
+            # decoded up front.
+            if encoding != 'utf-8':
+                document = document.decode(encoding)
+
+            if self.max_depth is not None and \
+                    self.depth(document) > self.max_depth:
+                raise response.HttpBadRequestException()
+
+            return json.loads(document)
+        except (ValueError, RecursionError):
+            raise response.HttpBadRequestException()
+
+
+class Upload:
+    """Data class for a file uploaded as part of a multipart form."""
+
+    def __init__(self, filename, content_type, file):
+        """
+        Instantiates an upload of the file named 'filename' by the client,
+        sent as 'content_type'. Its contents can be read from the file object
+        'file', which is deleted once closed.
+        """
+
+        self.filename = filename
+        self.content_type = content_type
+        self.file = file
+
+
+class MultipartParser:
+    """Incremental parser for multipart/form-data entities.
+
+    Entities are fed to the parser chunk by chunk. Only the unparsed tail of
+    the last chunk is kept around; the contents of every part are written out
+    as soon as they are known not to be part of a boundary. Fields are
+    collected in memory, files in temporary files that move to disk once they
+    outgrow the memory threshold. Fields and files in memory share a budget
+    across all parts, so many small parts cannot add up to more memory than
+    that. See RFC7578 for the format.
+    """
+
+    # A parameter of a Content-Disposition header. Browsers put file names in
+    # quoted strings as they are, with characters beyond ASCII, so these are
+    # read more leniently than the quoted strings of other headers.
+    RE_PARAMETER = re.compile(
+        r'\s*;\s*(?P<key>[^\s;=]+)\s*=\s*'
+        r'(?:"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<token>[^\s;"]*))\s*',
+        re.DOTALL
+    )
+
+    PREAMBLE = 'preamble'
+    DELIMITER = 'delimiter'
+    HEADERS = 'headers'
+    BODY = 'body'
+    EPILOGUE = 'epilogue'
+
+    def __init__(self, boundary, memory_threshold, max_field_length,
+                 max_header_length, max_parts, max_memory):
+        """
+        Instantiates a parser for parts separated by the bytes 'boundary'.
+        Files are kept in memory up to 'memory_threshold' bytes. Fields may be
+        'max_field_length' bytes long, the headers of a part up to
+        'max_header_length' bytes. There may be up to 'max_parts' parts, and
+        fields and files take up to 'max_memory' bytes of memory together.
+        """
+
+        # The line break preceding a boundary belongs to the boundary. One is
+        # put in front of the entity so the first boundary is no exception.
+        self.delimiter = b'\r\n--' + boundary
+        self.buffer = b'\r\n'
+        self.state = self.PREAMBLE
+
+        self.memory_threshold = memory_threshold
+        self.max_field_length = max_field_length
+        self.max_header_length = max_header_length
+        self.max_parts = max_parts
+        self.max_memory = max_memory
+
+        # The bytes of all parts kept in memory, and those of the file being
+        # read if it is still in memory, None if it is not.
+        self.memory = 0
+        self.spooled = None
+
+        # The parts read so far as (name, value) pairs, the last of which is
+        # being read. Values are bytearrays for fields and uploads for files.
+        self.parts = []
+
+    def feed(self, chunk):
+        """Parses the bytes 'chunk' following the ones fed before."""
+
+        self.buffer += chunk
+        while self.step():
+            pass
+
+    def close(self):
+        """
+        Finishes parsing, returning the parts read. Raises ValueError when the
+        entity ended before its closing boundary.
+        """
+
+        if self.state != self.EPILOGUE:
+            raise ValueError('Multipart entity is incomplete')
+
+        for name, value in self.parts:
+            if isinstance(value, Upload):
+                value.file.seek(0)
+
+        return self.parts
+
+    def step(self):
+        """
+        Parses what it can of the buffer in the current state. Returns a
+        boolean indicating whether there may be more to parse.
+        """
+
+        if self.state in (self.PREAMBLE, self.BODY):
+            found = self.buffer.find(self.delimiter)
+            if found < 0:
+                # The end of the buffer may be the start of a boundary.
+                keep = len(self.delimiter) - 1
+                if self.state == self.BODY:
+                    self.write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+                return False
+
+            if self.state == self.BODY:
+                self.write(self.buffer[:found])
+
+            self.buffer = self.buffer[found + len(self.delimiter):]
+            self.state = self.DELIMITER
+            return True
+
+        if self.state == self.DELIMITER:
+            # A boundary is followed by two dashes if it is the last one, by
+            # optional whitespace and a line break otherwise.
+            if self.buffer.startswith(b'--'):
+                self.buffer = b''
+                self.state = self.EPILOGUE
+                return False
+
+            end = self.buffer.find(b'\r\n')
+            if end < 0:
+                if len(self.buffer) > self.max_header_length:
+                    raise ValueError('Malformed multipart boundary')
+                return False
+
+            if self.buffer[:end].strip(b' \t'):
+                raise ValueError('Malformed multipart boundary')
+
+            # The line break is kept, so the headers end in the same way
+            # whether there are any or not.
+            self.buffer = self.buffer[end:]
+            self.state = self.HEADERS
+            return True
+
+        if self.state == self.HEADERS:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(self.buffer) > self.max_header_length:
+                    raise ValueError('Multipart headers too long')
+                return False
+
+            self.start(self.buffer[2:end])
+            self.buffer = self.buffer[end + 4:]
+            self.state = self.BODY
+            return True
+
+        # Anything after the closing boundary is ignored.
+        self.buffer = b''
+        return False
+
+    def start(self, headers):
+        """Starts reading a part with the header block 'headers'."""
+
+        disposition = content_type = None
+        for line in headers.decode('utf-8', 'replace').split('\r\n'):
+            name, colon, value = line.partition(':')
+            if not colon:
+                raise ValueError('Malformed multipart header: {0}'
+                                 .format(line))
+
+            name = name.strip().lower()
+            if name == 'content-disposition':
+                disposition = value.strip()
+            elif name == 'content-type':
+                content_type = value.strip()
+
+        # Every part names the field it is for -- RFC7578 section 4.2.
+        if disposition is None or \
+                disposition.split(';', 1)[0].strip().lower() != 'form-data':
+            raise ValueError('Part is not form data')
+
+        semicolon = disposition.find(';')
+        parameters = self.parse_disposition(
+            disposition[semicolon:] if semicolon >= 0 else ''
+        )
+        if 'name' not in parameters:
+            raise ValueError('Part has no name')
+
+        if len(self.parts) >= self.max_parts:
+            raise response.HttpRequestEntityTooLargeException()
+
+        if 'filename' in parameters:
+            # The file is moved to disk by write, which keeps track of the
+            # memory it takes.
+            value = Upload(
+                parameters['filename'],
+                content_type,
+                tempfile.SpooledTemporaryFile()
+            )
+            self.spooled = 0
+        else:
+            value = bytearray()
+
+        self.parts.append((parameters['name'], value))
+
+    def parse_disposition(self, encoded):
+        """
+        Parses the parameters 'encoded' of a Content-Disposition header into a
+        dictionary. Raises ValueError when they are malformed.
+        """
+
+        parameters = {}
+        position = 0
+        while position < len(encoded):
+            match = self.RE_PARAMETER.match(encoded, position)
+            if match is None:
+                raise ValueError('Malformed Content-Disposition: {0}'
+                                 .format(encoded))
+
+            # Only quotes and backslashes are escaped -- RFC7578 section 4.2.
+            value = match.group('token')
+            if value is None:
+                value = re.sub(r'\\([\\"])', r'\1', match.group('quoted'))
+
+            parameters[match.group('key').lower()] = value
+            position = match.end()
+
+        return parameters
+
+    def write(self, data):
+        """Appends the bytes 'data' to the part being read."""
+
+        if not data:
+            return
+
+        name, value = self.parts[-1]
+        if isinstance(value, Upload):
+            if self.spooled is not None:
+                if self.spooled + len(data) > self.memory_threshold or \
+                        self.memory + len(data) > self.max_memory:
+                    value.file.rollover()
+                    self.memory -= self.spooled
+                    self.spooled = None
+                else:
+                    self.spooled += len(data)
+                    self.memory += len(data)
+
+            value.file.write(data)
+        elif len(value) + len(data) > self.max_field_length or \
+                self.memory + len(data) > self.max_memory:
+            raise response.HttpRequestEntityTooLargeException()
+        else:
+            value += data
+            self.memory += len(data)
+
+    def discard(self):
+        """Closes the files of the parts read so far, deleting them."""
+
+        for name, value in self.parts:
+            if isinstance(value, Upload):
+                value.file.close()
+
+
+class MultipartFaucet(IncomingFaucet):
+    """
+    Faucet that processes multipart form data. The entity is read and parsed
+    in chunks, so the memory taken by an upload is bounded by the memory
+    threshold rather than by the size of the files uploaded.
+
+    Fields are decoded to strings, files become Upload instances. Like the
+    FormFaucet, a dictionary mapping names to lists of values is produced.
+    """
+
+    default_charset = 'utf-8'
+
+    mimetypes = {
+        mime.MimeType('multipart', 'form-data')
+    }
+
+    # The longest header block of a single part, and the most parts.
+    max_header_length = 8192
+    max_parts = 1000
+
+    def __init__(self, chunk_size=64 * 1024, memory_threshold=1024 * 1024,
+                 max_length=None, max_field_length=1024 * 1024,
+                 max_memory=8 * 1024 * 1024):
+        """
+        Instantiates a faucet reading the entity 'chunk_size' bytes at a time.
+        Uploaded files larger than 'memory_threshold' bytes are spooled to
+        disk. Entities may be up to 'max_length' bytes long, fields other than
+        files up to 'max_field_length' bytes. Fields and files kept in memory
+        take up to 'max_memory' bytes together; files beyond that are spooled
+        to disk, while fields beyond it are rejected.
+        """
+
+        self.chunk_size = chunk_size
+        self.memory_threshold = memory_threshold
+        self.max_length = max_length
+        self.max_field_length = max_field_length
+        self.max_memory = max_memory
+
+    def read(self, request):
+        return request.read_chunks(self.chunk_size, self.max_length)
+
+    def incoming(self, flow):
+        parameters = flow.mimetype.parameters if flow.mimetype else {}
+        if 'boundary' not in parameters:
+            raise response.HttpBadRequestException()
+
+        try:
+            boundary = parameters['boundary'].encode('ascii')
+        except UnicodeEncodeError:
+            raise response.HttpBadRequestException()
+
+        parser = MultipartParser(boundary, self.memory_threshold,
+                                 self.max_field_length, self.max_header_length,
+                                 self.max_parts, self.max_memory)
+
+        # Whole entities are accepted as well as chunks of one.
+        chunks = [flow.data] if isinstance(flow.data, bytes) else flow.data
+
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+            parts = parser.close()
+        except ValueError:
+            parser.discard()
+            raise response.HttpBadRequestException()
+        except BaseException:
+            # Do not leave temporary files behind, whatever went wrong.
+            parser.discard()
+            raise
+
+        return self.collect(parts)
+
+    def collect(self, parts):
+        """
+        Returns a dictionary mapping the names of the fields and files among
+        'parts' to lists of their values.
+        """
+
+        # The form may tell its own charset, c.f.
+        # http://www.w3.org/TR/html5/forms.html#multipart-form-data
+        charset = self.default_charset
+        for name, value in parts:
+            if name == '_charset_' and not isinstance(value, Upload):
+                charset = value.decode('ascii', 'ignore').strip() or charset
+
+        try:
+            codec = codecs.lookup(charset)
+        except LookupError:
+            codec = codecs.lookup(self.default_charset)
+
+        collected = {}
+        for name, value in parts:
+            if not isinstance(value, Upload):
+                value = codec.decode(value, 'replace')[0]
+            collected.setdefault(name, []).append(value)
+
+        return collected
+
+
+class FragmentCacheExtension(jinja2.ext.Extension):
+    """Jinja extension caching rendered template fragments.
+
+    Adds a {% cache key, ttl %}...{% endcache %} tag. The body is rendered
+    once and reused for as long as it is in the environment's fragment cache,
+    or for 'ttl' seconds at most if given.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(jinja2.nodes.Const(None))
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('render_fragment', args)
+        return jinja2.nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def render_fragment(self, key, ttl, caller):
+        """
+        Returns the fragment cached for 'key', rendering it by calling
+        'caller' and caching it for 'ttl' seconds if it is not cached.
+        """
+
+        fragments = self.environment.fragment_cache
+        if fragments is None:
+            return caller()
+
+        fragment = fragments.get(key)
+        if fragment is None:
+            fragment = caller()
+            fragments.put(key, fragment,
+                          size=len(fragment.encode('utf-8')), ttl=ttl)
+
+        return fragment
 
 
 class JinjaFaucet(OutgoingFaucet):
@@ -178,18 +800,85 @@ class JinjaFaucet(OutgoingFaucet):
         mime.MimeType('text', 'html')
     }
 
-    def __init__(self, template_location):
+    # The template used for endpoints that do not specify one.
+    default_template = 'default.html'
+
+    def __init__(self, template_location, stream=False, buffer_size=None,
+                 bytecode_cache=None, auto_reload=True, fragment_cache=None):
+        """
+        Instantiates a faucet rendering templates from 'template_location'.
+        When 'stream' is set, pages are rendered piecemeal as the response is
+        sent rather than in full up front. Rendered pieces are then gathered
+        in groups of 'buffer_size' before being sent, if it is larger than 1.
+
+        Compiled templates are stored in the directory 'bytecode_cache' if
+        given, which may be shared by all workers. In production, setting
+        'auto_reload' to False saves checking template files for changes on
+        every lookup.
+
+        Fragments in {% cache %} tags are kept in the ExpiringCache instance
+        'fragment_cache', or in one holding up to 1024 fragments and 8 MiB if
+        not given. Its hit and miss counts tell how well it is sized.
+        """
+
+        if bytecode_cache is not None:
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache)
+
+        if fragment_cache is None:
+            fragment_cache = cache.ExpiringCache(1024, 8 * 1024 * 1024)
+
         self.environment = jinja2.Environment(
             loader=jinja2.FileSystemLoader(template_location),
+            bytecode_cache=bytecode_cache,
+            auto_reload=auto_reload,
+            extensions=[FragmentCacheExtension],
         )
+        self.environment.fragment_cache = fragment_cache
+        self.fragment_cache = fragment_cache
+        self.stream = stream
+        self.buffer_size = buffer_size
 
-    def outgoing(self, flow):
+    def preload(self, endpoints):
+        """
+        Compiles the templates of the endpoints in 'endpoints' as well as the
+        default template, sparing the first requests for them the wait.
+        """
+
+        for endpoint in endpoints:
+            if hasattr(endpoint, 'template'):
+                self.environment.get_template(endpoint.template)
+
+        # Not every application has a default template.
         try:
-            template = self.environment.get_template(flow.endpoint.template)
+            self.environment.get_template(self.default_template)
+        except jinja2.TemplateNotFound:
+            pass
+
+    def get_template(self, flow):
+        """
+        Returns the template associated with the endpoint of 'flow', falling
+        back to the default template if there is none.
+        """
+
+        try:
+            return self.environment.get_template(flow.endpoint.template)
         except AttributeError:
-            template = self.environment.get_template('default.html')
+            return self.environment.get_template(self.default_template)
+
+    def outgoing(self, flow):
+        template = self.get_template(flow)
 
-        return template.render(flow.data)
+        if not self.stream:
+            return template.render(flow.data)
+
+        # Rendering happens as the application iterates over the stream.
+        stream = template.stream(flow.data)
+        # Groups of a single piece are no groups at all, and Jinja refuses to
+        # buffer them.
+        if self.buffer_size is not None and self.buffer_size > 1:
+            stream.enable_buffering(self.buffer_size)
+
+        return stream
 
 
 class EuphemeJsonEncoder(json.JSONEncoder):
@@ -217,10 +906,209 @@ class JsonFaucet(OutgoingFaucet):
 
     encoder = None
 
-    def __init__(self):
+    def __init__(self, stream_threshold=1000):
+        """
+        Instantiates a JSON faucet. Generators and other iterators, as well
+        as lists and tuples of at least 'stream_threshold' items, are encoded
+        and sent element by element rather than in one go.
+        """
+
         self.encoder = EuphemeJsonEncoder()
+        self.stream_threshold = stream_threshold
+
+    def streamable(self, o):
+        """
+        Returns a boolean indicating whether 'o' is a collection that should
+        be streamed, or a dictionary directly containing one.
+        """
+
+        if isinstance(o, dict):
+            return any(self.streamable(value) for value in o.values()
+                       if not isinstance(value, dict))
+
+        if isinstance(o, (list, tuple)):
+            return len(o) >= self.stream_threshold
+
+        return hasattr(o, '__next__')
+
+    def stream(self, o):
+        """
+        Encodes 'o' as JSON, yielding the encoded elements of streamed
+        collections one at a time. Objects that are encoded by calling their
+        to_json_compat method are only converted once they are reached.
+        """
+
+        if hasattr(o, 'to_json_compat'):
+            o = o.to_json_compat()
+
+        if not self.streamable(o):
+            yield self.encoder.encode(o)
+        elif isinstance(o, dict):
+            yield '{'
+            for index, (key, value) in enumerate(o.items()):
+                if index:
+                    yield self.encoder.item_separator
+
+                # JSON object keys are strings; coerce keys as json does.
+                if not isinstance(key, str):
+                    key = self.encoder.encode(key).strip('"')
+
+                yield self.encoder.encode(key) + self.encoder.key_separator
+                yield from self.stream(value)
+            yield '}'
+        else:
+            yield '['
+            for index, item in enumerate(o):
+                if index:
+                    yield self.encoder.item_separator
+                yield from self.stream(item)
+            yield ']'
 
     def outgoing(self, flow):
         # TODO: Mechanism to selectively exclude items from the output.
 
+        if self.streamable(flow.data):
+            return self.stream(flow.data)
+
         return self.encoder.encode(flow.data)
+
+
+class BinaryFaucet(OutgoingFaucet):
+    """
+    Faucet that passes binary data through unchanged. Endpoints may produce
+    bytes, bytearrays, memoryviews or file objects, which are served without
+    a charset and with their length.
+    """
+
+    def __init__(self, *mimetypes):
+        """
+        Instantiates a faucet for the mime types 'mimetypes', either strings
+        or MimeType instances, application/octet-stream if none are given.
+        """
+
+        self.mimetypes = set(parse_strings(
+            mimetypes or ['application/octet-stream']
+        ))
+
+    def outgoing(self, flow):
+        return flow.data
+
+
+class NdjsonFaucet(OutgoingFaucet):
+    """
+    Faucet that processes outgoing data by encoding every record produced by
+    the endpoint as a line of JSON, sent as soon as the record is produced.
+    """
+
+    mimetypes = {
+        mime.MimeType('application', 'x-ndjson')
+    }
+
+    def __init__(self):
+        self.encoder = EuphemeJsonEncoder()
+
+    def outgoing(self, flow):
+        return self.lines(flow.data)
+
+    def lines(self, records):
+        """Yields the records in 'records' as lines of JSON."""
+
+        for record in records:
+            # Without indentation, encoded JSON holds no line breaks.
+            yield self.encoder.encode(record) + '\n'
+
+
+class Event:
+    """Data class for a server-sent event with a name, id or retry time."""
+
+    def __init__(self, data, event=None, id=None, retry=None):
+        """
+        Instantiates an event carrying 'data'. The optional 'event' names the
+        event, 'id' sets the client's last event id and 'retry' is the time in
+        milliseconds the client should wait before reconnecting.
+        """
+
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+
+class EventStreamFaucet(OutgoingFaucet):
+    """
+    Faucet that processes outgoing data as server-sent events. Every record
+    produced by the endpoint is sent as an event as soon as it is produced;
+    records that are not Event instances become unnamed events.
+
+    An endpoint with nothing to send can yield None. If nothing was sent for
+    'keepalive' seconds by then, a comment is sent to keep the connection
+    from being closed by proxies along the way.
+    """
+
+    mimetypes = {
+        mime.MimeType('text', 'event-stream')
+    }
+
+    # The only line breaks of the format; str.splitlines knows many more.
+    RE_LINE_BREAK = re.compile(r'\r\n|\r|\n')
+
+    def __init__(self, keepalive=15, clock=time.monotonic):
+        self.encoder = EuphemeJsonEncoder()
+        self.keepalive = keepalive
+        self.clock = clock
+
+    def outgoing(self, flow):
+        return self.events(flow.data)
+
+    def events(self, records):
+        """Yields the records in 'records' as encoded server-sent events."""
+
+        last = self.clock()
+
+        for record in records:
+            if record is None:
+                if self.clock() - last < self.keepalive:
+                    continue
+                encoded = ': keepalive\n\n'
+            else:
+                encoded = self.encode(record)
+
+            yield encoded
+            last = self.clock()
+
+    def field(self, value):
+        """
+        Returns 'value' as the value of a single field. Raises ValueError if
+        it holds a line break, which would end the field and start another.
+        """
+
+        value = str(value)
+        if '\r' in value or '\n' in value or '\0' in value:
+            raise ValueError('Invalid event field: {0!r}'.format(value))
+
+        return value
+
+    def encode(self, record):
+        """Encodes 'record' as an event in the text/event-stream format."""
+
+        if not isinstance(record, Event):
+            record = Event(record)
+
+        lines = []
+        if record.event is not None:
+            lines.append('event: {0}'.format(self.field(record.event)))
+        if record.id is not None:
+            lines.append('id: {0}'.format(self.field(record.id)))
+        if record.retry is not None:
+            lines.append('retry: {0}'.format(int(record.retry)))
+
+        # Text is sent as is, anything else as JSON. Every line of the data
+        # gets a field of its own.
+        data = record.data
+        if not isinstance(data, str):
+            data = self.encoder.encode(data)
+
+        for line in self.RE_LINE_BREAK.split(data):
+            lines.append('data: {0}'.format(line))
+
+        return '\n'.join(lines) + '\n\n'
@@ -1,27 +1,88 @@
 import re
 import codecs
+import types
 
+import eupheme.cache as cache
 import eupheme.negotiation as negotiation
 
 # A token as described in RFC2045 section 5.1. Consists of any ASCII character
 # except non-printable ones, spaces as well as ( ) < > @ , ; \ " [ ] ? =
 RE_TOKEN = re.compile(r'^[^\x00-\x20\x80-\xff()<>@,;:\\"/\[\]?=]+$')
 
+# The name of a type parameter; c.f. to RFC2045 section 5.1.
+RE_KEY = re.compile(r'\w+')
 
-class MimeParameters:
-    # The rough structure for a type parameter; c.f. to RFC2045 section 5.1.
-    RE_PARAMETER = re.compile('^(?P<key>\w+)=(?P<value>.*)$', re.DOTALL)
 
-    # A quoted string as specified in RFC822 section 3.3.
-    RE_QUOTED_STRING = re.compile(
-        r'^"('
-        # qtext: any ASCII character excepting <"> and "\".
-        # All carriage returns (\r) must be followed by a line feed (\n).
-        r'[^\\\"\r\x80-\xff]|' '\r\n|'
-        # quoted-pair: any ASCII character prepended with a backslash.
-        r'\\[\x00-\x7f]'
-        r')*"$'
-    )
+def scan_quoted(encoded, position):
+    """
+    Scans the quoted string as specified in RFC822 section 3.3 that starts at
+    'position' in 'encoded'. Returns a pair of the unquoted string and the
+    position just past its closing quote. Raises ValueError when the quoted
+    string is malformed or not terminated.
+
+    Every character is looked at exactly once, so the time taken is linear in
+    the length of the quoted string whatever its contents.
+    """
+
+    unquoted = []
+    length = len(encoded)
+    position += 1  # Skip the opening quote.
+
+    while position < length:
+        char = encoded[position]
+
+        if char == '"':
+            return ''.join(unquoted), position + 1
+
+        if char == '\\':
+            # quoted-pair: any ASCII character prepended with a backslash.
+            if position + 1 >= length or encoded[position + 1] > '\x7f':
+                break
+            # A backslash before a line feed has always been left in place.
+            quoted = encoded[position + 1]
+            unquoted.append(quoted if quoted != '\n' else '\\\n')
+            position += 2
+        elif char == '\r':
+            # All carriage returns must be followed by a line feed.
+            if encoded[position + 1:position + 2] != '\n':
+                break
+            unquoted.append('\r\n')
+            position += 2
+        elif '\x80' <= char <= '\xff':
+            # qtext: any ASCII character excepting <"> and "\".
+            break
+        else:
+            unquoted.append(char)
+            position += 1
+
+    raise ValueError('Invalid quoted string: {0}'.format(encoded))
+
+
+class Immutable:
+    """Base class for value objects whose attributes are set only once."""
+
+    __slots__ = ()
+
+    def assign(self, **attributes):
+        """Sets the attributes in 'attributes', for use while initializing."""
+
+        for name, value in attributes.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{0} is immutable'.format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('{0} is immutable'.format(type(self).__name__))
+
+
+class MimeParameters(Immutable):
+    """The parameters of a mime type, immutable once created."""
+
+    __slots__ = ('values', 'quality', 'string', 'length')
+
+    # The most parameters that are parsed from a single string.
+    max_parameters = 32
 
     def __init__(self, encoded=None, **parameters):
         """
@@ -31,40 +92,90 @@ class MimeParameters:
         """
 
         # Copy over the keyword arguments
-        self.values = {}
-        for key, value in parameters.items():
-            self[key] = value
+        values = {key: str(value) for key, value in parameters.items()}
+
+        if encoded is not None:
+            values.update(self.parse(encoded))
 
-        if encoded is None:
-            return  # Do not bother parsing if we have no encoded parameters.
+        # Parse the quality right away, rejecting invalid values early.
+        if 'q' in values:
+            quality = negotiation.parse_quality(values['q'])
+        else:
+            quality = negotiation.QUALITY_DEFAULT
 
-        # Parse additional parameters specified in the mimetype.
-        for parameter in encoded.split(';'):
-            parameter = parameter.strip()
-            if not parameter:
-                continue  # Skip empty parameters
+        self.assign(
+            values=types.MappingProxyType(values),
+            quality=quality,
+            string=self.encode(values),
+            length=len(values) - 1 if 'q' in values else len(values)
+        )
 
-            match = self.RE_PARAMETER.match(parameter)
-            if match is None:
-                raise ValueError('Invalid parameter: {0}'.format(parameter))
+    def parse(self, encoded):
+        """
+        Parses the parameters specified in a mime type, 'encoded', and returns
+        them as a dictionary.
+        """
 
-            key = match.group('key')
-            value = match.group('value')
+        values = {}
+        count = 0
+        position = 0
+        length = len(encoded)
+
+        # Scan the parameters in a single pass. Every search starts where the
+        # previous one left off, keeping the time taken linear in the length
+        # of the parameters.
+        while position < length:
+            char = encoded[position]
+            if char == ';' or char.isspace():
+                position += 1
+                continue  # Skip separators and empty parameters
+
+            count += 1
+            if count > self.max_parameters:
+                raise ValueError('Too many parameters: {0}'.format(encoded))
+
+            # The key runs up to the equals sign.
+            equals = encoded.find('=', position)
+            if equals < 0 or not RE_KEY.fullmatch(encoded, position, equals):
+                raise ValueError('Invalid parameter: {0}'.format(
+                    encoded[position:]))
+            key = encoded[position:equals]
 
             # Value can either be a token or a quoted string
-            if RE_TOKEN.match(value):
-                self[key] = value
-            elif self.RE_QUOTED_STRING.match(value):
-                # We got a quoted string, unquote
-                self[key] = re.sub(r'\\(.)', r'\1', value[1:-1])
+            if encoded.startswith('"', equals + 1):
+                value, position = scan_quoted(encoded, equals + 1)
+                value_end = position
+                position = encoded.find(';', position)
+                if position < 0:
+                    position = length
+
+                # Only whitespace may follow the closing quote.
+                if encoded[value_end:position].strip():
+                    raise ValueError('Invalid parameter value: {0}'.format(
+                        encoded[equals + 1:position]))
             else:
-                raise ValueError('Invalid parameter value: {0}'.format(value))
+                position = encoded.find(';', equals)
+                if position < 0:
+                    position = length
 
-    def __str__(self):
-        """Encodes the MimeParameters back into a string."""
+                value = encoded[equals + 1:position].rstrip()
+                if not RE_TOKEN.match(value):
+                    raise ValueError(
+                        'Invalid parameter value: {0}'.format(value))
+
+            values[key] = value
+
+        return values
+
+    @staticmethod
+    def encode(values):
+        """
+        Encodes the parameters in the dictionary 'values' into their canonical
+        string form, ordered by key.
+        """
 
         encoded = []
-        for key, value in self.values.items():
+        for key, value in sorted(values.items()):
             if not RE_TOKEN.match(value):
                 # The token cannot be encoded directly, escape any character
                 # that needs quoting in a quoted-string (quotes, backslashes
@@ -75,16 +186,16 @@ class MimeParameters:
             encoded.append('{0}={1}'.format(key, value))
         return '; '.join(encoded)
 
+    def __str__(self):
+        """Encodes the MimeParameters back into a string."""
+
+        return self.string
+
     def __getitem__(self, key):
         """Returns the value for the parameter 'key', if it exists."""
 
         return self.values[key]
 
-    def __setitem__(self, key, value):
-        """Sets the value for the parameter 'key' to 'value'."""
-
-        self.values[key] = str(value)
-
     def __contains__(self, key):
         """Returns a boolean indicating the existence of parameter 'key'."""
 
@@ -96,7 +207,7 @@ class MimeParameters:
         parameter if it exists.
         """
 
-        return len(self.values)-1 if 'q' in self else len(self.values)
+        return self.length
 
     def __le__(self, other):
         """
@@ -110,11 +221,18 @@ class MimeParameters:
         return True
 
 
-class MimeType(negotiation.Negotiable):
-    # The rough structure for a MIME type; c.f. RFC2045 section 5.1.
-    RE_MIMETYPE = re.compile(r'^(?P<type>.+)/'
-                             r'(?P<subtype>.+?)'
-                             r'(?P<parameters>;.*)?$')
+class MimeType(Immutable, negotiation.Negotiable):
+    """Represents a mime type, immutable once created.
+
+    Mime types are value objects; their string form and hash are computed
+    once. Mime types parsed from strings are interned, such that equal types
+    parsed from different headers are the very same instance.
+    """
+
+    __slots__ = ('type', 'subtype', 'parameters', 'quality', 'string', 'hash')
+
+    # The longest string parsed as a mime type, parameters included.
+    max_length = 1024
 
     # Media types as registered with IANA, refer to
     # http://www.iana.org/assignments/media-types
@@ -130,12 +248,25 @@ class MimeType(negotiation.Negotiable):
         'video'
     ]
 
+    # Interned mime types by the strings they were parsed from as well as by
+    # their canonical string form.
+    interned = cache.LruCache(1024)
+
     def __init__(self, type_, subtype, **parameters):
         """
         Instantiates a mimetype with type 'type_' and subtype 'subtype'.
         Additional type parameters can be passed as keyword arguments.
         """
 
+        self.initialize(type_, subtype, MimeParameters(**parameters))
+
+    def initialize(self, type_, subtype, parameters):
+        """
+        Validates and sets the type 'type_', subtype 'subtype' and the
+        MimeParameters instance 'parameters', along with the canonical string
+        form and hash derived from them.
+        """
+
         if not RE_TOKEN.match(type_):
             raise ValueError('Invalid type token: {0}'.format(type_))
 
@@ -147,27 +278,73 @@ class MimeType(negotiation.Negotiable):
         if not self.media_type_valid(type_):
             raise ValueError('Invalid media type: "{0}"'.format(type_))
 
-        self.type = type_
-        self.subtype = subtype
-        self.parameters = MimeParameters(**parameters)
-
         # Types such as '*/html' are not allowed.
-        if self.type == '*' and self.subtype != '*':
+        if type_ == '*' and subtype != '*':
             raise ValueError('Type wildcard without subtype wildcard')
 
+        # The canonical form includes the quality parameter, so that ranges
+        # differing in quality only are not interned as one.
+        if not parameters.values:
+            string = "{0}/{1}".format(type_, subtype)
+        else:
+            string = "{0}/{1}; {2}".format(type_, subtype, str(parameters))
+
+        self.assign(
+            type=type_,
+            subtype=subtype,
+            parameters=parameters,
+            quality=parameters.quality,
+            string=string,
+            hash=hash(string)
+        )
+
     @classmethod
     def parse(cls, encoded):
         """Parses a string into a MimeType instance."""
 
-        match = cls.RE_MIMETYPE.match(encoded)
-        if match is None:
+        mimetype = cls.interned.get(encoded)
+        if mimetype is not None:
+            return mimetype
+
+        if len(encoded) > cls.max_length:
+            raise ValueError('Mimetype too long: {0}'.format(encoded[:64]))
+
+        # The rough structure for a MIME type is TYPE/SUBTYPE;PARAMETERS, c.f.
+        # RFC2045 section 5.1. The type and subtype are validated as tokens.
+        slash = encoded.find('/')
+        if slash < 0:
             raise ValueError('Could not parse mimetype: {0}'
                              .format(encoded))
 
-        mimetype = cls(match.group('type'), match.group('subtype'))
-        mimetype.parameters = MimeParameters(match.group('parameters'))
+        semicolon = encoded.find(';', slash)
+        if semicolon < 0:
+            subtype, parameters = encoded[slash + 1:], None
+        else:
+            subtype = encoded[slash + 1:semicolon]
+            parameters = encoded[semicolon:]
+
+        mimetype = cls.__new__(cls)
+        mimetype.initialize(encoded[:slash], subtype,
+                            MimeParameters(parameters))
+
+        mimetype = cls.intern(mimetype)
+        cls.interned.put(encoded, mimetype)
         return mimetype
 
+    @classmethod
+    def intern(cls, mimetype):
+        """
+        Returns the interned instance equal to 'mimetype', interning the
+        mime type itself if there is no such instance yet.
+        """
+
+        interned = cls.interned.get(mimetype.string)
+        if interned is None:
+            cls.interned.put(mimetype.string, mimetype)
+            interned = mimetype
+
+        return interned
+
     def media_type_valid(self, value):
         """
         Checks whether a media type is either one of the types registered with
@@ -181,12 +358,32 @@ class MimeType(negotiation.Negotiable):
     def __str__(self):
         """Returns a string representation of the mime type."""
 
-        if not len(self.parameters):
-            return "{0}/{1}".format(self.type, self.subtype)
+        return self.string
+
+    @property
+    def essence(self):
+        """The mime type without any of its parameters."""
+
+        if not self.parameters.values:
+            return self
 
-        return "{0}/{1}; {2}".format(self.type,
-                                     self.subtype,
-                                     str(self.parameters))
+        return self.parse('{0}/{1}'.format(self.type, self.subtype))
+
+    @property
+    def index_key(self):
+        """The type and subtype, the key for mime types in a RangeIndex."""
+
+        return self.type, self.subtype
+
+    def lookup_keys(self):
+        """
+        Returns the keys of the media ranges this mime type may satisfy: its
+        own, that of its type's wildcard range and that of the */* range.
+        """
+
+        return ((self.type, self.subtype),
+                (self.type, '*'),
+                ('*', '*'))
 
     def __contains__(self, other):
         """
@@ -234,44 +431,163 @@ class MimeType(negotiation.Negotiable):
         return len(self.parameters) > len(other.parameters)
 
     def __hash__(self):
-        return hash(str(self))
+        return self.hash
 
     def __eq__(self, other):
-        return str(self) == str(other)
+        if self is other:
+            return True
 
+        # Mime types compare equal to their string form as well.
+        if isinstance(other, MimeType):
+            return self.hash == other.hash and self.string == other.string
 
-class CharacterSet(negotiation.Negotiable):
-    """Represents a character set."""
+        return self.string == str(other)
 
-    # Rough format as in RFC2616 section 14.2.
-    RE_CHARSET = re.compile(r'^(?P<name>.+?)(?P<params>;.*)?$')
 
-    def __init__(self, name, quality='1'):
-        """Instantiates a charset with name 'name' and quality 'quality'."""
+class Token(Immutable, negotiation.Negotiable):
+    """Base class for negotiables consisting of a name and parameters.
 
-        self.codec = codecs.lookup(name)
-        self.parameters = MimeParameters(q=quality)
+    Character sets and content codings are interned value objects identified
+    by their canonical name and parameters. Subclasses supply the names they
+    know aliases for, the lookup of the canonical name and the matching rules.
+    """
+
+    __slots__ = ('name', 'parameters', 'quality', 'string', 'hash')
+
+    # Names mapped to the name they are an alias of, in lower case.
+    ALIASES = {}
+
+    # The longest string parsed, parameters included.
+    max_length = 256
+
+    # Interned instances by the strings they were parsed from as well as by
+    # their canonical string form. Every subclass has a table of its own.
+    interned = None
+
+    def __init__(self, name, quality='1', **parameters):
+        """
+        Instantiates a negotiable with name 'name' and quality 'quality'.
+        Further parameters can be specified as keyword arguments; a 'q'
+        parameter among them takes precedence over 'quality'.
+        """
+
+        parameters.setdefault('q', quality)
+        self.initialize(name, MimeParameters(**parameters))
+
+    def lookup(self, name):
+        """
+        Should be overridden to return a dictionary of the attributes for the
+        lower case name 'name', the canonical name under 'name' among them.
+        Raises LookupError for unknown names.
+        """
+
+        raise NotImplementedError
+
+    def initialize(self, name, parameters):
+        """
+        Validates and looks up the name 'name' and sets it along with the
+        MimeParameters instance 'parameters', the canonical string form and
+        hash derived from them.
+        """
+
+        if RE_TOKEN.match(name) is None:
+            raise ValueError('Invalid token: {0}'.format(name))
+
+        name = name.lower()
+        attributes = self.lookup(self.ALIASES.get(name, name))
+        string = '{0}; {1}'.format(attributes['name'], str(parameters))
+
+        self.assign(
+            parameters=parameters,
+            quality=parameters.quality,
+            string=string,
+            hash=hash(string),
+            **attributes
+        )
 
     @classmethod
     def parse(cls, encoded):
         """
-        Parses an encoded character set and its parameters and returns the
-        result. The expected format is as in RFC2616 section 14.2.
+        Parses an encoded name and its parameters and returns the result, as
+        in an Accept-Charset or Accept-Encoding header.
         """
 
-        match = cls.RE_CHARSET.match(encoded)
-        if match is None:
-            raise ValueError('Invalid character set: {0}'.format(encoded))
+        token = cls.interned.get(encoded)
+        if token is not None:
+            return token
+
+        if len(encoded) > cls.max_length:
+            raise ValueError('{0} too long: {1}'.format(cls.__name__,
+                                                        encoded[:64]))
+
+        # The name runs up to the parameters, if there are any.
+        semicolon = encoded.find(';')
+        if semicolon < 0:
+            name, parameters = encoded, None
+        else:
+            name, parameters = encoded[:semicolon], encoded[semicolon:]
+
+        # A quality parameter among the encoded ones overrides the default.
+        token = cls.__new__(cls)
+        token.initialize(name.strip(), MimeParameters(parameters, q='1'))
+
+        token = cls.intern(token)
+        cls.interned.put(encoded, token)
+        return token
+
+    @classmethod
+    def intern(cls, token):
+        """
+        Returns the interned instance equal to 'token', interning the token
+        itself if there is no such instance yet.
+        """
+
+        interned = cls.interned.get(token.string)
+        if interned is None:
+            cls.interned.put(token.string, token)
+            interned = token
+
+        return interned
+
+    def __str__(self):
+        return self.string
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+
+        return (isinstance(other, type(self)) and
+                self.hash == other.hash and self.string == other.string)
+
+    @property
+    def index_key(self):
+        """The canonical name, the key for tokens in a RangeIndex."""
+
+        return self.name
+
 
-        # The charset set name must be a valid token; c.f. RFC2616 section 3.4
-        if RE_TOKEN.match(match.group('name')) is None:
-            raise ValueError('Invalid token: {0}'.format(encoded))
+class CharacterSet(Token):
+    """Represents a character set, immutable once created.
 
-        charset = cls(match.group('name'))
-        if match.group('params') is not None:
-            charset.parameters = MimeParameters(match.group('params'))
+    Character sets are identified by their canonical codec name; aliases are
+    resolved by the codecs module.
+    """
 
-        return charset
+    __slots__ = ('codec',)
+
+    interned = cache.LruCache(256)
+
+    def lookup(self, name):
+        codec = codecs.lookup(name)
+        return {'codec': codec, 'name': codec.name}
+
+    def lookup_keys(self):
+        """Returns the keys of the character sets this set may satisfy."""
+
+        return (self.codec.name,)
 
     def __contains__(self, other):
         """Checks whether this character set is satisfied by 'other'."""
@@ -286,3 +602,45 @@ class CharacterSet(negotiation.Negotiable):
         # Since there is no way of telling whether one codec satisfies another,
         # we simply order them alphabetically.
         return self.codec.name < other.codec.name
+
+
+class ContentCoding(Token):
+    """Represents a content coding, immutable once created.
+
+    Content codings are identified by their lowercase name, aliases resolved.
+    The name '*' stands for any coding.
+    """
+
+    __slots__ = ()
+
+    # Names codings are also known by -- RFC2616 section 3.5.
+    ALIASES = {
+        'x-gzip': 'gzip',
+        'x-compress': 'compress',
+    }
+
+    interned = cache.LruCache(256)
+
+    def lookup(self, name):
+        return {'name': name}
+
+    def lookup_keys(self):
+        """
+        Returns the keys of the content codings this coding may satisfy: its
+        own and the wildcard.
+        """
+
+        return (self.name, '*')
+
+    def __contains__(self, other):
+        """Checks whether this content coding is satisfied by 'other'."""
+
+        return self.name == '*' or self.name == other.name
+
+    def __gt__(self, other):
+        """
+        Returns a boolean indicating whether the content coding 'other' is
+        less strict than the present one, being the wildcard.
+        """
+
+        return other.name == '*' and self.name != '*'
@@ -1,19 +1,54 @@
-import decimal
+import re
 
+import eupheme.cache as cache
 import eupheme.response as response
 
+# A quality value as in RFC7231 section 5.3.1; at most three decimals.
+RE_QUALITY = re.compile(r'^(?:0(?:\.[0-9]{0,3})?|1(?:\.0{0,3})?)$')
+
+# The quality assigned when none is given, in thousandths.
+QUALITY_DEFAULT = 1000
+
+
+def parse_quality(value):
+    """
+    Parses the quality value 'value' into an integer number of thousandths.
+    Raises ValueError when the value is not a valid quality value.
+    """
+
+    if RE_QUALITY.match(value) is None:
+        raise ValueError('Invalid quality value: {0}'.format(value))
+
+    whole, _, fraction = value.partition('.')
+    return int(whole) * 1000 + int(fraction.ljust(3, '0'))
+
 
 class Negotiable:
-    """Represents a property that can be negotiated."""
+    """Represents a property that can be negotiated.
+
+    Negotiables carry their parameters in a 'parameters' attribute and their
+    quality, as an integer number of thousandths, in a 'quality' attribute.
+    """
+
+    __slots__ = ()
 
     @property
-    def quality(self):
-        """The mime quality parameter as a decimal."""
+    def index_key(self):
+        """
+        Should be overridden to return the key under which this negotiable is
+        filed in a RangeIndex when requested.
+        """
 
-        try:
-            return decimal.Decimal(self.parameters['q'])
-        except KeyError:
-            return decimal.Decimal('1')
+        raise NotImplementedError
+
+    def lookup_keys(self):
+        """
+        Should be overridden to return the keys under which requested
+        negotiables satisfied by this negotiable are filed in a RangeIndex,
+        from the most specific key to the least specific one.
+        """
+
+        raise NotImplementedError
 
     def __contains__(self, other):
         """
@@ -32,6 +67,129 @@ class Negotiable:
         raise NotImplementedError
 
 
+class RangeIndex(frozenset):
+    """A set of requested negotiables, indexed for matching against offers.
+
+    The negotiables are filed in buckets by their index key, each bucket
+    ordered from the most specific negotiable to the least specific one. The
+    closest match for an offer is thereby found in a few lookups, however many
+    negotiables a client requests.
+    """
+
+    def __init__(self, requested):
+        """Indexes the negotiables in 'requested'."""
+
+        super().__init__()
+
+        self.buckets = {}
+        for negotiable in self:
+            bucket = self.buckets.setdefault(negotiable.index_key, [])
+            bucket.append(negotiable)
+
+        # Negotiables in one bucket only differ in their parameters; the more
+        # parameters, the more specific. Ties go to the highest quality.
+        for bucket in self.buckets.values():
+            bucket.sort(key=lambda negotiable: (-len(negotiable.parameters),
+                                                -negotiable.quality))
+
+    def closest(self, offer):
+        """
+        Returns the closest match for the negotiable 'offer' among those in
+        the index. Throws a ValueError when no matching offer is found.
+        """
+
+        for key in offer.lookup_keys():
+            for negotiable in self.buckets.get(key, ()):
+                if offer in negotiable:
+                    return negotiable
+
+        raise ValueError('No match for {0}'.format(offer))
+
+
+def closest_match(requested, offer):
+    """
+    Returns the closest match for the negotiable 'offer' among those in
+    'requested'. Throws a ValueError when no matching offer is found.
+    """
+
+    if isinstance(requested, RangeIndex):
+        return requested.closest(offer)
+
+    return max(req for req in requested if offer in req)
+
+
+def best_offer(requested, offered):
+    """
+    Returns the offer from 'offered' that is assigned the highest quality
+    among the negotiables in 'requested'. Returns None if none of the offers
+    made satisfies any of the requested negotiables. Offers whose closest
+    match has a quality of zero are not acceptable -- RFC2616 section 3.9.
+    """
+
+    best = None
+    best_quality = None
+
+    # Index the requested negotiables once, rather than scanning all of them
+    # for every offer.
+    if not isinstance(requested, RangeIndex):
+        requested = RangeIndex(requested)
+
+    for offer in offered:
+        try:
+            # Find the most specific match for this offer.
+            match = closest_match(requested, offer)
+        except ValueError:
+            # This offer does not satisfy any request.
+            continue
+
+        # Check if this offer represents a better (client-assigned) quality
+        # than any offer we have been able to make.
+        quality = match.quality
+        if quality > 0 and (best is None or best_quality < quality):
+            best = offer
+            best_quality = quality
+
+    return best
+
+
+class Negotiation:
+    """The outcome of negotiating the output of an endpoint.
+
+    Besides the negotiated mime type, character set and content coding, holds
+    the key under which the outcome was cached and the request headers that
+    key is made of, which are the headers a Vary response header should list.
+    """
+
+    # Request headers, in the form they take in the WSGI environment, that
+    # take part in negotiating the output of an endpoint.
+    HEADERS = (
+        ('Accept', 'HTTP_ACCEPT'),
+        ('Accept-Charset', 'HTTP_ACCEPT_CHARSET'),
+        ('Accept-Encoding', 'HTTP_ACCEPT_ENCODING'),
+    )
+
+    def __init__(self, key, produces, mimetype, charset, coding=None):
+        """
+        Instantiates the outcome 'mimetype', 'charset' and 'coding' of a
+        negotiation keyed on 'key' against the set of mime types 'produces'.
+        A mime type of None represents a failed negotiation, a coding of None
+        one in which no content coding was negotiated.
+        """
+
+        self.key = key
+        self.produces = produces
+        self.mimetype = mimetype
+        self.charset = charset
+        self.coding = coding
+
+    @property
+    def vary(self):
+        """The names of the request headers the outcome depends on."""
+
+        return [name for name, variable in self.HEADERS
+                if name != 'Accept-Encoding' or self.coding is not None]
+
+
 class Broker:
     """Brokers incoming HTTP requests.
 
@@ -40,18 +198,38 @@ class Broker:
     will throw the appropriate HttpException when negotiations break down.
     """
 
-    def __init__(self, charsets, default_charset, methods, default_mimetype):
+    def __init__(self, charsets, default_charset, methods, default_mimetype,
+                 cache_size=256, codings=()):
         """
         Instantiates a broker object which can offer the character sets in
         'charsets' and the methods in 'methods'. If no character set is
         requested, it will fall back to 'default_charset'. Likewise, if no
-        content type is requested, 'default_mimetype' will be chosen.
+        content type is requested, 'default_mimetype' will be chosen. The
+        outcomes of up to 'cache_size' negotiations are remembered. The
+        content codings in 'codings', the identity coding among them, are
+        offered in order of preference; if there are none, no content coding
+        is negotiated at all.
         """
 
         self.charsets = charsets
         self.default_charset = default_charset
         self.methods = methods
         self.default_mimetype = default_mimetype
+        self.negotiations = cache.LruCache(cache_size)
+        self.codings = tuple(codings)
+        self.identity = next(
+            (coding for coding in self.codings if coding.name == 'identity'),
+            None
+        )
+
+    def invalidate(self):
+        """
+        Forgets all remembered negotiations. Replacing the mime types produced
+        by an endpoint is noticed automatically, but changing the set in place
+        or changing the character sets offered is not.
+        """
+
+        self.negotiations.clear()
 
     def closest_match(self, requested, offer):
         """
@@ -59,7 +237,7 @@ class Broker:
         'requested'. Throws a ValueError when no matching offer is found.
         """
 
-        return max(req for req in requested if offer in req)
+        return closest_match(requested, offer)
 
     def best_offer(self, requested, offered):
         """
@@ -68,24 +246,7 @@ class Broker:
         offers made satisfies any of the requested negotiables.
         """
 
-        best = None
-        best_quality = None
-
-        for offer in offered:
-            try:
-                # Find the most specific match for this offer.
-                match = self.closest_match(requested, offer)
-            except ValueError:
-                # This offer does not satisfy any request.
-                continue
-
-            # Check if this offer represents a better (client-assigned) quality
-            # than any offer we have been able to make.
-            if best is None or best_quality < match.quality:
-                best = offer
-                best_quality = match.quality
-
-        return best
+        return best_offer(requested, offered)
 
     def negotiate_endpoint(self, method, resource):
         """
@@ -127,24 +288,46 @@ class Broker:
 
         return charset
 
+    def negotiate_coding(self, accepted):
+        """
+        Negotiates the content coding, given the codings accepted by the
+        client in 'accepted'. Returns the negotiated content coding, the
+        identity coding if the response is not to be compressed.
+        """
+
+        if accepted is None:
+            # Any coding is acceptable without an Accept-Encoding header, but
+            # the client is better off without one -- RFC7231 section 5.3.4.
+            return self.identity
+
+        coding = self.best_offer(accepted, self.codings)
+        if coding is None:
+            # Like character sets, we reject the request if we support none
+            # of the codings the client accepts -- RFC2616 section 14.3.
+            raise response.HttpNotAcceptableException()
+
+        return coding
+
     def negotiate_input(self, request, endpoint):
         """
         Negotiates the input mime type when 'request' is routed to 'endpoint'.
-        Returns the data when accepted, None when there is no input data.
+        Returns the mime type of the entity without its parameters when it is
+        accepted, None when there is no input data.
         """
 
-        if request.content_length is None or request.content_type is None:
+        if request.content_length is None or request.mimetype is None:
             # No input content given, nothing to negotiate about.
-            return
+            return None
 
-        if request.content_type not in endpoint.consumes:
+        # Parameters such as the charset qualify the entity rather than its
+        # type, so the entity is accepted by its type and subtype.
+        mimetype = request.mimetype.essence
+        if mimetype not in endpoint.consumes and \
+                request.mimetype not in endpoint.consumes:
             # We cannot parse the content type -- RFC2616 section 10.4.16.
             raise response.HttpUnsupportedMediaTypeException()
 
-        if request.content_length is not None:
-            return request.read_entity()
-        else:
-            return None
+        return mimetype
 
     def negotiate_output(self, request, endpoint):
         """
@@ -164,3 +347,39 @@ class Broker:
                 raise response.HttpNotAcceptableException()
 
         return mimetype
+
+    def negotiate(self, request, endpoint):
+        """
+        Negotiates the output mime type, character set and content coding when
+        'request' is routed to 'endpoint'. The outcome depends only on the
+        endpoint and the raw Accept, Accept-Charset and Accept-Encoding
+        headers, and is remembered as such. Returns a Negotiation holding the
+        outcome on success.
+        """
+
+        key = (endpoint,) + tuple(
+            request.environ.get(variable)
+            for name, variable in Negotiation.HEADERS
+        )
+        produces = getattr(endpoint, 'produces', None)
+
+        negotiation = self.negotiations.get(key)
+        if negotiation is None or negotiation.produces is not produces:
+            try:
+                negotiation = Negotiation(
+                    key,
+                    produces,
+                    self.negotiate_output(request, endpoint),
+                    self.negotiate_charset(request.accept_charset),
+                    self.negotiate_coding(request.accept_encoding)
+                    if self.codings else None
+                )
+            except response.HttpNotAcceptableException:
+                negotiation = Negotiation(key, produces, None, None)
+
+            self.negotiations.put(key, negotiation)
+
+        if negotiation.mimetype is None:
+            raise response.HttpNotAcceptableException()
+
+        return negotiation
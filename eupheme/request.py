@@ -1,18 +1,121 @@
 import urllib.parse
 
+import eupheme.cache as cache
 import eupheme.response as response
 import eupheme.mime as mime
+import eupheme.negotiation as negotiation
 import eupheme.cookies as cookies
 
 
+# Cached result for header values that could not be parsed.
+MALFORMED = object()
+
+# Marks values of a request that have not been parsed yet.
+UNSET = object()
+
+# The identity coding as implied by an Accept-Encoding header that does not
+# mention it: acceptable, though less so than anything asked for.
+IMPLICIT_IDENTITY = mime.ContentCoding('identity', quality='0.001')
+
+
+def parse_accept(header):
+    """
+    Parses the value of an Accept header into a RangeIndex of media ranges.
+    Raises ValueError when any of the ranges is malformed.
+    """
+
+    return negotiation.RangeIndex(
+        mime.MimeType.parse(accept.strip()) for accept in header.split(',')
+    )
+
+
+def parse_accept_charset(header):
+    """
+    Parses the value of an Accept-Charset header into a RangeIndex of character
+    sets, leaving out those we do not know. Raises ValueError when any of the
+    character sets is malformed.
+    """
+
+    accept_charset = set()
+    for charset_string in header.split(','):
+        try:
+            accept_charset.add(mime.CharacterSet.parse(charset_string.strip()))
+        except LookupError:
+            # We cannot find the character set requested, carry on.
+            continue
+
+    return negotiation.RangeIndex(accept_charset)
+
+
+def parse_accept_encoding(header):
+    """
+    Parses the value of an Accept-Encoding header into a RangeIndex of content
+    codings. The identity coding is acceptable unless it is excluded, be it by
+    name or by the wildcard -- RFC7231 section 5.3.4. Raises ValueError when
+    any of the content codings is malformed.
+    """
+
+    accept_encoding = {
+        mime.ContentCoding.parse(coding.strip())
+        for coding in header.split(',') if coding.strip()
+    }
+
+    if not any(coding.name in ('identity', '*')
+               for coding in accept_encoding):
+        accept_encoding.add(IMPLICIT_IDENTITY)
+
+    return negotiation.RangeIndex(accept_encoding)
+
+
+def parse_cache_control(header):
+    """
+    Parses the value of a Cache-Control header into a dictionary mapping its
+    directives, in lower case, to their argument or None if they have none.
+    """
+
+    directives = {}
+    for directive in header.split(','):
+        name, separator, argument = directive.partition('=')
+        name = name.strip().lower()
+        if name:
+            directives[name] = argument.strip().strip('"') if separator \
+                else None
+
+    return directives
+
+
 class Request:
-    """A request issued by a client."""
+    """A request issued by a client.
+
+    Only the request method, path and a few raw values are taken from the
+    environment up front. Headers, cookies and the query string are parsed on
+    first access, so requests that are turned down early, or endpoints that
+    never look at them, do not pay for parsing them.
+    """
+
+    __slots__ = (
+        'start_response', 'environ', 'method', 'body', 'content_type',
+        'path', 'query_string', '_content_length', '_mimetype', '_cookies',
+        '_accept', '_accept_charset', '_accept_encoding', '_cache_control',
+        '_query'
+    )
+
+    # Parsed Accept, Accept-Charset and Accept-Encoding headers by their raw
+    # value. Clients send only a handful of distinct values, so these are
+    # parsed just once.
+    accept_cache = cache.LruCache(256)
+    accept_charset_cache = cache.LruCache(256)
+    accept_encoding_cache = cache.LruCache(256)
+    cache_control_cache = cache.LruCache(256)
+
+    # The longest Accept header of any kind that is parsed at all.
+    max_header_length = 8192
 
     def __init__(self, environ, start_response):
         """
         Takes a parameter dictionary 'environ' and a callable 'start_response'
-        as specified by PEP3333 and initializes values of interest to us,
-        parsing them where necessary.
+        as specified by PEP3333 and initializes values of interest to us.
+        Values that need parsing are parsed when first accessed.
         """
 
         self.start_response = start_response
@@ -21,72 +124,269 @@ class Request:
         # Presence of these keys is guaranteed by PEP3333
         self.method = environ['REQUEST_METHOD']
         self.body = environ['wsgi.input']
-        self.cookies = cookies.CookieManager.load(
-            environ.get('HTTP_COOKIE', {}), ro=True
-        )
 
         # These keys may or may not be present, or empty if they are.
         self.content_type = environ.get('CONTENT_TYPE', None)
-        self.content_length = environ.get('CONTENT_LENGTH', None)
-        if self.content_length:
-            try:
-                self.content_length = int(self.content_length)
-            except ValueError:
-                # Content-Length header is present but not numeric, violating
-                # the format in RFC2616 section 14.13.
-                raise response.HttpBadRequestException()
 
-        if not self.content_length:
-            self.content_length = None
+        # The query string is not part of PATH_INFO, but a key of its own --
+        # PEP3333.
+        self.path = self.split_path(environ.get('PATH_INFO', ''))
+        self.query_string = environ.get('QUERY_STRING', '')
+
+        self._content_length = UNSET
+        self._mimetype = UNSET
+        self._cookies = UNSET
+        self._accept = UNSET
+        self._accept_charset = UNSET
+        self._accept_encoding = UNSET
+        self._cache_control = UNSET
+        self._query = UNSET
+
+    @property
+    def content_length(self):
+        """The length of the request entity, or None if there is none."""
 
-        # Iterate through the content types accepted by the client
-        if 'HTTP_ACCEPT' in environ:
-            self.accept = set()
-            for accept in environ['HTTP_ACCEPT'].split(','):
+        if self._content_length is UNSET:
+            content_length = self.environ.get('CONTENT_LENGTH', None)
+            if content_length:
                 try:
-                    self.accept.add(mime.MimeType.parse(accept.strip()))
+                    content_length = int(content_length)
                 except ValueError:
+                    # Content-Length header is present but not numeric,
+                    # violating the format in RFC2616 section 14.13.
                     raise response.HttpBadRequestException()
-        else:
-            self.accept = None
 
-        # Iterate through the character sets requested by the client.
-        if 'HTTP_ACCEPT_CHARSET' in environ:
-            self.accept_charset = set()
-            for charset_string in environ['HTTP_ACCEPT_CHARSET'].split(','):
+            self._content_length = content_length or None
+
+        return self._content_length
+
+    @property
+    def mimetype(self):
+        """The parsed content type of the request entity, or None."""
+
+        if self._mimetype is UNSET:
+            if self.content_type:
                 try:
-                    self.accept_charset.add(mime.CharacterSet.parse(
-                        charset_string.strip()
-                    ))
-                except LookupError:
-                    # We cannot find the character set requested, carry on.
-                    continue
+                    self._mimetype = mime.MimeType.parse(self.content_type)
                 except ValueError:
-                    # The character set was malformed, drop everything.
+                    # The Content-Type header does not follow the format in
+                    # RFC2616 section 14.17.
                     raise response.HttpBadRequestException()
-        else:
-            # Signals that the user did not request any character set in
-            # particular. Note how this is different from not being able to
-            # find any of the requested sets; in this case, we can choose.
-            self.accept_charset = None
+            else:
+                self._mimetype = None
+
+        return self._mimetype
+
+    @property
+    def cookies(self):
+        """A read-only CookieManager holding the cookies sent."""
+
+        if self._cookies is UNSET:
+            self._cookies = cookies.CookieManager.load(
+                self.environ.get('HTTP_COOKIE', {}), ro=True
+            )
+
+        return self._cookies
+
+    @property
+    def accept(self):
+        """The content types accepted by the client, or None."""
+
+        if self._accept is UNSET:
+            if 'HTTP_ACCEPT' in self.environ:
+                self._accept = self.parse_header(
+                    self.accept_cache,
+                    parse_accept,
+                    self.environ['HTTP_ACCEPT']
+                )
+            else:
+                self._accept = None
+
+        return self._accept
+
+    @property
+    def accept_charset(self):
+        """The character sets requested by the client, or None."""
+
+        if self._accept_charset is UNSET:
+            if 'HTTP_ACCEPT_CHARSET' in self.environ:
+                self._accept_charset = self.parse_header(
+                    self.accept_charset_cache,
+                    parse_accept_charset,
+                    self.environ['HTTP_ACCEPT_CHARSET']
+                )
+            else:
+                # Signals that the user did not request any character set in
+                # particular. Note how this is different from not being able
+                # to find any of the requested sets; in this case, we can
+                # choose.
+                self._accept_charset = None
+
+        return self._accept_charset
+
+    @property
+    def accept_encoding(self):
+        """The content codings accepted by the client, or None."""
+
+        if self._accept_encoding is UNSET:
+            if 'HTTP_ACCEPT_ENCODING' in self.environ:
+                self._accept_encoding = self.parse_header(
+                    self.accept_encoding_cache,
+                    parse_accept_encoding,
+                    self.environ['HTTP_ACCEPT_ENCODING']
+                )
+            else:
+                self._accept_encoding = None
 
-        self.path, self.query = self.parse_path(environ.get('PATH_INFO', ''))
+        return self._accept_encoding
 
-    def parse_path(self, path):
+    @property
+    def cache_control(self):
         """
-        Parses the http path in 'path'. Returns a tuple of the path component
-        and the parsed query string as a dictionary, in that order.
+        The directives of the Cache-Control header as a dictionary, which is
+        empty if there are none. The dictionary is shared between requests and
+        must not be modified.
         """
 
-        parsed = urllib.parse.urlparse(path)
-        return parsed.path, urllib.parse.parse_qs(parsed.query)
+        if self._cache_control is UNSET:
+            if 'HTTP_CACHE_CONTROL' in self.environ:
+                self._cache_control = self.parse_header(
+                    self.cache_control_cache,
+                    parse_cache_control,
+                    self.environ['HTTP_CACHE_CONTROL']
+                )
+            elif self.environ.get('HTTP_PRAGMA', '').strip() == 'no-cache':
+                # Pragma is only looked at in the absence of Cache-Control --
+                # RFC7234 section 5.4.
+                self._cache_control = {'no-cache': None}
+            else:
+                self._cache_control = {}
 
-    def read_entity(self):
-        """Reads the entity from the request and returns it."""
+        return self._cache_control
+
+    @property
+    def query(self):
+        """The parsed query string as a dictionary."""
+
+        if self._query is UNSET:
+            self._query = urllib.parse.parse_qs(self.query_string)
+
+        return self._query
+
+    def etag_matches(self, etag):
+        """
+        Returns a boolean indicating whether the entity tag 'etag' matches any
+        of those in the If-None-Match header, False if there is none. Tags are
+        compared weakly, as they are for conditional GET requests -- RFC7232
+        section 3.2.
+        """
+
+        header = self.environ.get('HTTP_IF_NONE_MATCH')
+        if header is None:
+            return False
+
+        opaque = etag[2:] if etag.startswith('W/') else etag
+        for tag in header.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+
+            if tag == '*' or tag == opaque:
+                return True
+
+        return False
+
+    @classmethod
+    def parse_header(cls, cache, parse, header):
+        """
+        Parses the header value 'header' with the callable 'parse', looking up
+        the result in 'cache' first. Raises HttpBadRequestException when the
+        header is malformed or too long.
+        """
+
+        if len(header) > cls.max_header_length:
+            raise response.HttpBadRequestException()
+
+        parsed = cache.get(header)
+        if parsed is None:
+            try:
+                parsed = parse(header)
+            except ValueError:
+                # Remember malformed values too, they tend to be repeated.
+                parsed = MALFORMED
+
+            cache.put(header, parsed)
+
+        if parsed is MALFORMED:
+            raise response.HttpBadRequestException()
+
+        return parsed
+
+    def split_path(self, path):
+        """
+        Returns the path component of the http path 'path', leaving out any
+        query string a server may have left in it.
+        """
+
+        return urllib.parse.urlparse(path).path
+
+    def read_entity(self, max_length=None):
+        """
+        Reads the entity from the request and returns it. Raises
+        HttpRequestEntityTooLargeException when the entity is longer than
+        'max_length' bytes, without reading it if its length is known.
+        """
 
         # TODO: This is not actually how an entity is read. Refer to RFC2616
         # section 4.4 for details on how to implement this properly.
         if self.content_length is not None:
+            if max_length is not None and self.content_length > max_length:
+                raise response.HttpRequestEntityTooLargeException()
+
             return self.body.read(self.content_length)
-        else:
+
+        if max_length is None:
             return self.body.read()
+
+        # Read a byte more than allowed to tell whether there is too much.
+        entity = self.body.read(max_length + 1)
+        if len(entity) > max_length:
+            raise response.HttpRequestEntityTooLargeException()
+
+        return entity
+
+    def read_chunks(self, chunk_size, max_length=None):
+        """
+        Returns an iterator over the entity of the request in chunks of at
+        most 'chunk_size' bytes, reading each chunk as it is needed. Raises
+        HttpRequestEntityTooLargeException when the entity is longer than
+        'max_length' bytes, right away if its length is known.
+        """
+
+        if max_length is not None and self.content_length is not None and \
+                self.content_length > max_length:
+            raise response.HttpRequestEntityTooLargeException()
+
+        return self.iterate_chunks(chunk_size, max_length)
+
+    def iterate_chunks(self, chunk_size, max_length):
+        """Yields the chunks of the entity for read_chunks."""
+
+        remaining = self.content_length
+        read = 0
+
+        while remaining is None or remaining > 0:
+            if remaining is None:
+                chunk = self.body.read(chunk_size)
+            else:
+                chunk = self.body.read(min(chunk_size, remaining))
+                remaining -= len(chunk)
+
+            if not chunk:
+                return  # The client sent less than it announced.
+
+            read += len(chunk)
+            if max_length is not None and read > max_length:
+                raise response.HttpRequestEntityTooLargeException()
+
+            yield chunk
@@ -3,6 +3,7 @@ import eupheme.cookies
 
 
 STATUS_OK = '200 OK'
+STATUS_PARTIAL_CONTENT = '206 Partial Content'
 
 
 class HttpException(Exception):
@@ -49,6 +50,12 @@ class HttpMovedException(HttpException):
         self.location = location
 
 
+class HttpNotModifiedException(HttpException):
+    """The representation the client has is still up to date."""
+
+    status = '304 Not Modified'
+
+
 class HttpBadRequestException(HttpException):
     """The client has issued an invalid request."""
     status = '400 Bad Request'
@@ -71,12 +78,29 @@ class HttpNotAcceptableException(HttpException):
     status = '406 Not Acceptable'
 
 
+class HttpRequestEntityTooLargeException(HttpException):
+    """The request entity is larger than the server is willing to process."""
+
+    status = '413 Request Entity Too Large'
+
+
 class HttpUnsupportedMediaTypeException(HttpException):
     """The server cannot process the media type sent."""
 
     status = '415 Unsupported Media Type'
 
 
+class HttpRangeNotSatisfiableException(HttpException):
+    """None of the byte ranges requested lie within the representation."""
+
+    status = '416 Requested Range Not Satisfiable'
+
+    def __init__(self, length):
+        super().__init__()
+        # The actual length is sent along -- RFC7233 section 4.4.
+        self.headers['Content-Range'] = 'bytes */{0}'.format(length)
+
+
 class HttpInternalServerErrorException(HttpException):
     """An internal error occurred on the server."""
 
@@ -1,6 +1,129 @@
 import re
+import uuid
+
+import eupheme.cache as cache
 import eupheme.response as response
 
+# Characters that carry special meaning in a regular expression when they
+# appear unescaped outside of a character class.
+SPECIAL = frozenset('.^$*+?{}[]\\|()')
+
+# Characters that turn the atom preceding them into an optional or repeated
+# one, meaning that atom cannot be part of the static prefix of a route.
+QUANTIFIERS = frozenset('*+?{')
+
+# Constructs that refer back to groups by number or name. Patterns containing
+# these cannot be merged into a combined regular expression, as merging
+# renumbers their groups.
+RE_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+# A typed path segment such as {id:int}, naming the segment and its converter.
+RE_PLACEHOLDER = re.compile(r'\{(?P<name>[A-Za-z_]\w*):(?P<type>\w+)\}')
+
+
+class Converter:
+    """Parses a typed path segment into a value of that type."""
+
+    def __init__(self, regex, convert):
+        """
+        Instantiates a converter for segments matching the regular expression
+        'regex', which the callable 'convert' turns into a value. The callable
+        may raise ValueError to reject a segment.
+        """
+
+        self.regex = regex
+        self.convert = convert
+
+
+# Converters available to typed path segments, by name.
+CONVERTERS = {
+    'str': Converter(r'[^/]+', str),
+    'int': Converter(r'[0-9]+', int),
+    'float': Converter(r'[0-9]+(?:\.[0-9]+)?', float),
+    'uuid': Converter(
+        r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+        r'[0-9a-fA-F]{4}-[0-9a-fA-F]{12}',
+        uuid.UUID
+    ),
+    'path': Converter(r'.+', str),
+}
+
+
+def has_alternation(pattern):
+    """
+    Returns a boolean indicating whether the regular expression 'pattern' has
+    an alternation at its top level, outside any group or character class.
+    """
+
+    depth = 0
+    in_class = False
+    escaped = False
+
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+
+    return False
+
+
+def split_literal(pattern):
+    """
+    Splits the regular expression 'pattern' into the literal text any path it
+    matches must start with. Returns a pair of that prefix and a boolean that
+    indicates whether the pattern consists of the prefix alone, anchored at the
+    end of the path by $.
+    """
+
+    # Matching is always anchored at the start of the path.
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+
+    # With an alternation at the top level, no prefix is shared by all paths.
+    if has_alternation(pattern):
+        return '', False
+
+    prefix = []
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if char == '\\':
+            # Only escaped punctuation is literal; \d, \b, \1 and friends
+            # are character classes, assertions or back references.
+            if position + 1 >= len(pattern) or \
+                    pattern[position + 1].isalnum():
+                break
+            char = pattern[position + 1]
+            length = 2
+        elif char in SPECIAL:
+            break
+        else:
+            length = 1
+
+        # A quantified character is optional, hence not part of the prefix.
+        following = pattern[position + length:position + length + 1]
+        if following and following in QUANTIFIERS:
+            break
+
+        prefix.append(char)
+        position += length
+
+    # Like the literal lookup, $ also matches before a trailing newline. \Z
+    # does not, and is left to the regular expression.
+    remainder = pattern[position:]
+    return ''.join(prefix), remainder == '$'
+
 
 class Route:
     """Represents a route served by the application."""
@@ -8,20 +131,293 @@ class Route:
     def __init__(self, pattern, resource):
         """Instantiates a route.
 
-        The argument 'pattern' is assumed to be a valid regular expression.
+        The argument 'pattern' is assumed to be a valid regular expression. It
+        may contain typed segments such as {id:int}, which match the segment
+        and convert it using the converter named after the colon.
         """
 
+        # Subpatterns to convert, by their position among the subpatterns.
+        self.converters = {}
+
+        if isinstance(pattern, str) and RE_PLACEHOLDER.search(pattern):
+            pattern = self.expand(pattern)
+
         self.pattern = re.compile(pattern)
         self.resource = resource
 
+    def expand(self, pattern):
+        """
+        Replaces the typed segments in 'pattern' by subpatterns for their
+        converters and returns the resulting regular expression.
+        """
+
+        converters = []
+
+        def replace(match):
+            try:
+                converter = CONVERTERS[match.group('type')]
+            except KeyError:
+                raise ValueError('Unknown converter: {0}'
+                                 .format(match.group('type')))
+
+            converters.append(converter)
+            return '(?P<_segment{0}>{1})'.format(len(converters) - 1,
+                                                 converter.regex)
+
+        # Name the subpatterns for now, so their positions can be looked up.
+        expanded = RE_PLACEHOLDER.sub(replace, pattern)
+        for name, group in re.compile(expanded).groupindex.items():
+            if name.startswith('_segment'):
+                converter = converters[int(name[len('_segment'):])]
+                self.converters[group - 1] = converter
+
+        return re.sub(r'\(\?P<_segment\d+>', '(', expanded)
+
+    def convert(self, groups):
+        """
+        Converts the typed segments among the subpatterns 'groups' matched by
+        this route. Raises ValueError when a segment is rejected.
+        """
+
+        if not self.converters:
+            return groups
+
+        groups = list(groups)
+        for index, converter in self.converters.items():
+            if groups[index] is not None:
+                groups[index] = converter.convert(groups[index])
+
+        return tuple(groups)
+
+    def split(self):
+        """
+        Returns a pair of the static prefix of this route's pattern and a
+        boolean indicating whether the pattern matches that literal path only.
+        """
+
+        source = self.pattern.pattern
+        if not isinstance(source, str) or self.pattern.flags & ~re.UNICODE:
+            # Patterns compiled with flags may match differently cased paths.
+            return '', False
+
+        return split_literal(source)
+
+    def combinable(self):
+        """
+        Returns a boolean indicating whether this route's pattern can be merged
+        with those of other routes into a single alternation.
+        """
+
+        source = self.pattern.pattern
+        return (isinstance(source, str) and
+                not self.pattern.flags & ~re.UNICODE and
+                not self.pattern.groupindex and
+                RE_BACKREFERENCE.search(source) is None)
+
+
+class RadixNode:
+    """A node in the radix tree of static route prefixes.
+
+    Every node holds the routes whose static prefix is the concatenation of
+    the labels on the way down from the root. Routes stored in the same node
+    are merged into a single alternation where possible.
+    """
+
+    def __init__(self, label):
+        """Instantiates a node labelled 'label' without routes or children."""
+
+        self.label = label
+        self.children = {}
+        self.entries = []
+
+        self.first = None
+        self.combined = None
+        self.markers = {}
+        self.standalone = []
+
+    def insert(self, key):
+        """
+        Returns the node for the prefix 'key' relative to this node, creating
+        it and splitting existing edges where necessary.
+        """
+
+        if not key:
+            return self
+
+        child = self.children.get(key[0])
+        if child is None:
+            child = self.children[key[0]] = RadixNode(key)
+            return child
+
+        # Determine how much of the edge label the key shares.
+        common = 0
+        limit = min(len(key), len(child.label))
+        while common < limit and key[common] == child.label[common]:
+            common += 1
+
+        if common < len(child.label):
+            # Split the edge, putting a new node at the point of divergence.
+            split = RadixNode(child.label[:common])
+            child.label = child.label[common:]
+            split.children[child.label[0]] = child
+            self.children[key[0]] = child = split
+
+        return child.insert(key[common:])
+
+    def compile(self):
+        """
+        Merges the routes of this node and of all nodes below it into their
+        combined regular expressions.
+        """
+
+        alternatives = []
+        group = 0
+
+        for index, route in self.entries:
+            if not route.combinable():
+                self.standalone.append((index, route))
+                continue
+
+            # Every alternative ends with an empty marker group. As it closes
+            # last, its number is the 'lastindex' of a successful match and
+            # identifies the route that matched.
+            alternatives.append('(?:{0})()'.format(route.pattern.pattern))
+            groups = route.pattern.groups
+            self.markers[group + groups + 1] = (index, group, groups)
+            group += groups + 1
+
+        if alternatives:
+            try:
+                self.combined = re.compile('|'.join(alternatives))
+            except re.error:
+                # Some construct did not survive being merged; match every
+                # route in this node on its own instead.
+                self.markers = {}
+                self.standalone = list(self.entries)
+
+        if self.entries:
+            self.first = self.entries[0][0]
+
+        for child in self.children.values():
+            child.compile()
+
+    def walk(self, path):
+        """
+        Yields the nodes holding routes whose static prefix is a prefix of
+        'path', from the shortest prefix to the longest.
+        """
+
+        node = self
+        position = 0
+
+        while True:
+            if node.entries:
+                yield node
+
+            if position >= len(path):
+                return
+
+            node = node.children.get(path[position])
+            if node is None or not path.startswith(node.label, position):
+                return
+
+            position += len(node.label)
+
+    def match(self, path, limit=None):
+        """
+        Returns a pair of the index of the first route in this node matching
+        'path' and the subpatterns it matched, or None if no route matches.
+        Only routes added before the route at index 'limit' are considered.
+        """
+
+        result = None
+
+        if self.combined is not None:
+            match = self.combined.match(path)
+            if match is not None:
+                index, offset, count = self.markers[match.lastindex]
+                if limit is None or index < limit:
+                    result = index, match.groups()[offset:offset + count]
+                    limit = index
+
+        for index, route in self.standalone:
+            if limit is not None and index >= limit:
+                break
+
+            match = route.pattern.match(path)
+            if match is not None:
+                return index, match.groups()
+
+        return result
+
+
+class RouteTable:
+    """A compiled, read-only snapshot of a routing table.
+
+    Routes consisting of a literal path are looked up in a dictionary, the
+    others are grouped by their static prefix in a radix tree. Lookups thereby
+    take time proportional to the length of the path rather than to the number
+    of routes, while the first route added still takes precedence.
+    """
+
+    def __init__(self, routes):
+        """Compiles the sequence of routes 'routes' into a routing table."""
+
+        self.routes = list(routes)
+        self.literals = {}
+        self.tree = RadixNode('')
+
+        for index, route in enumerate(self.routes):
+            prefix, exact = route.split()
+            if exact:
+                self.literals.setdefault(prefix, index)
+            else:
+                self.tree.insert(prefix).entries.append((index, route))
+
+        self.tree.compile()
+
+    def match(self, path):
+        """
+        Returns a pair of the first route matching 'path' and the subpatterns
+        it matched, or None if no route matches.
+        """
+
+        best = self.literals.get(path)
+        if best is None and path.endswith('\n'):
+            # The end of line anchor also matches before a trailing newline.
+            best = self.literals.get(path[:-1])
+        groups = ()
+
+        for node in self.tree.walk(path):
+            if best is not None and node.first >= best:
+                continue  # Every route in this node was added later.
+
+            found = node.match(path, best)
+            if found is not None:
+                best, groups = found
+
+        if best is None:
+            return None
+
+        return self.routes[best], groups
+
 
 class RouteManager:
     """Manages all routes served by the application."""
 
-    def __init__(self):
-        """Instantiates a route manager with an empty routing table."""
+    # Cached result for paths that did not match any route.
+    NOT_FOUND = object()
+
+    def __init__(self, cache_size=0):
+        """
+        Instantiates a route manager with an empty routing table. When
+        'cache_size' is positive, the results of up to that many distinct paths
+        are remembered, found or not.
+        """
 
         self.routes = []
+        self.table = None
+        self.cache = cache.LruCache(cache_size) if cache_size > 0 else None
 
     def add(self, pattern, resource):
         """
@@ -30,6 +426,19 @@ class RouteManager:
         """
 
         self.routes.append(Route(pattern, resource))
+        self.table = None
+
+        if self.cache is not None:
+            self.cache.clear()
+
+    def freeze(self):
+        """
+        Compiles the routes added so far into a routing table. This happens
+        automatically on the first match after routes have been added, but can
+        be done up front to keep the cost out of the first request.
+        """
+
+        self.table = RouteTable(self.routes)
 
     def match(self, path):
         """
@@ -38,9 +447,35 @@ class RouteManager:
         that order. Raises HttpNotFoundException if no matching path is found.
         """
 
-        for route in self.routes:
-            match = route.pattern.match(path)
-            if match:
-                return route.resource, match.groups()
+        if self.cache is not None:
+            found = self.cache.get(path)
+            if found is None:
+                found = self.lookup(path)
+                self.cache.put(path, found)
+        else:
+            found = self.lookup(path)
+
+        if found is self.NOT_FOUND:
+            raise response.HttpNotFoundException(path)
+
+        return found
+
+    def lookup(self, path):
+        """
+        Returns a pair of the resource matching 'path' and the subpatterns
+        matched, or NOT_FOUND when there is no such resource.
+        """
+
+        if self.table is None:
+            self.freeze()
+
+        found = self.table.match(path)
+        if found is None:
+            return self.NOT_FOUND
 
-        raise response.HttpNotFoundException(path)
+        route, groups = found
+        try:
+            return route.resource, route.convert(groups)
+        except ValueError:
+            # The segment has the right shape but is not a valid value.
+            return self.NOT_FOUND
@@ -0,0 +1,415 @@
+"""Module containing a resource serving static files from a directory."""
+import datetime
+import email.utils
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+import stat
+import tempfile
+
+import eupheme.cache as cache
+import eupheme.compression as compression
+import eupheme.faucets as faucets
+import eupheme.mime as mime
+import eupheme.negotiation as negotiation
+import eupheme.response as response
+
+# A single range of bytes, c.f. RFC7233 section 2.1. Either offset may be left
+# out, but not both.
+RE_RANGE = re.compile(r'bytes=(?P<first>[0-9]*)-(?P<last>[0-9]*)')
+
+
+class FileInfo:
+    """Data class for what is served along with a static file."""
+
+    def __init__(self, path, status):
+        """
+        Instantiates the information on the file at 'path' from the result of
+        os.stat for it, 'status'.
+        """
+
+        self.path = path
+        self.size = status.st_size
+        self.mtime = int(status.st_mtime)
+
+        # The cached information is validated against these, as the file is
+        # considered changed when its modification time, size or inode is.
+        self.version = (status.st_mtime_ns, status.st_size, status.st_ino)
+
+        self.etag = '"{0:x}-{1:x}"'.format(status.st_mtime_ns, status.st_size)
+        self.last_modified = email.utils.formatdate(self.mtime, usegmt=True)
+
+        # The FileInfo of the precompressed variant, once looked for. False
+        # if there is none.
+        self.variant = None
+
+
+class FileRange:
+    """File-like object reading a range of bytes from a file."""
+
+    def __init__(self, file, start, length):
+        """
+        Instantiates a range of 'length' bytes from the file object 'file',
+        starting at offset 'start'.
+        """
+
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        """Reads up to 'size' bytes, or all of the range that is left."""
+
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        """Closes the underlying file."""
+
+        self.file.close()
+
+
+class StaticFiles:
+    """Resource serving the files in a directory.
+
+    The resource is mounted with a route matching the path of the file within
+    the directory as its only subpattern, for example '^/static/{path:path}$'.
+    Files are sent through the server's file wrapper where there is one, and
+    answered with 304 when the client's copy is still up to date. Single byte
+    ranges are served as partial content.
+
+    Given a directory for them, gzipped variants of compressible files are
+    built once and served to clients accepting them.
+    """
+
+    allowed_methods = {'GET', 'HEAD'}
+
+    # Mime type for files of unknown type, and the charset of text files.
+    default_mimetype = 'application/octet-stream'
+    charset = 'utf-8'
+
+    # Types worth compressing besides text, and the smallest file compressed.
+    compressible = {
+        'application/javascript',
+        'application/json',
+        'application/xml',
+        'image/svg+xml',
+    }
+    min_compress_length = 256
+
+    def __init__(self, root, cache_size=1024, variants=None):
+        """
+        Instantiates a resource serving the files below the directory 'root'.
+        The ETag and Last-Modified values of up to 'cache_size' files are
+        remembered until the files change. Precompressed variants are kept
+        in the directory 'variants', if given.
+        """
+
+        self.root = os.path.realpath(root)
+        self.files = cache.LruCache(cache_size)
+        self.variants = os.path.realpath(variants) if variants else None
+
+    def locate(self, path):
+        """
+        Returns the absolute path of the file at 'path' within the root
+        directory. Raises HttpNotFoundException when the path leads outside.
+        """
+
+        if '\0' in path:
+            raise response.HttpNotFoundException(path)
+
+        located = os.path.realpath(os.path.join(self.root, path.lstrip('/')))
+        if not located.startswith(self.root + os.sep):
+            raise response.HttpNotFoundException(path)
+
+        return located
+
+    def info(self, path):
+        """
+        Returns the FileInfo for the regular file at 'path', looking it up in
+        the cache first. Raises HttpNotFoundException if there is no such file.
+        """
+
+        try:
+            status = os.stat(path)
+        except (OSError, ValueError):
+            raise response.HttpNotFoundException(path)
+
+        if not stat.S_ISREG(status.st_mode):
+            raise response.HttpNotFoundException(path)
+
+        info = self.files.get(path)
+        if info is None or \
+                info.version != (status.st_mtime_ns, status.st_size,
+                                 status.st_ino):
+            info = FileInfo(path, status)
+            self.files.put(path, info)
+
+        return info
+
+    def mimetype(self, path):
+        """Returns the mime type the file at 'path' is served as."""
+
+        guessed, encoding = mimetypes.guess_type(path)
+        try:
+            mimetype = mime.MimeType.parse(guessed or self.default_mimetype)
+        except ValueError:
+            mimetype = mime.MimeType.parse(self.default_mimetype)
+
+        if mimetype.type == 'text':
+            mimetype = mime.MimeType(mimetype.type, mimetype.subtype,
+                                     charset=self.charset)
+
+        return mimetype
+
+    def compresses(self, info, mimetype):
+        """
+        Returns a boolean indicating whether the file described by 'info' and
+        served as 'mimetype' has a precompressed variant.
+        """
+
+        return (self.variants is not None and
+                info.size >= self.min_compress_length and
+                (mimetype.type == 'text' or
+                 str(mimetype.essence) in self.compressible))
+
+    def variant(self, info):
+        """
+        Returns the FileInfo of the precompressed variant of the file described
+        by 'info', building it if it is not there or out of date. Returns None
+        if compressing the file does not make it any smaller.
+        """
+
+        if info.variant is None:
+            relative = os.path.relpath(info.path, self.root)
+            target = os.path.join(self.variants, relative + '.gz')
+
+            # Variants carry the modification time of the file they were built
+            # from, which tells whether they are out of date.
+            try:
+                status = os.stat(target)
+            except OSError:
+                status = None
+
+            if status is None or status.st_mtime_ns != info.version[0]:
+                status = self.compress(info, target)
+
+            if status is None:
+                info.variant = False
+            else:
+                variant = FileInfo(target, status)
+                variant.etag = info.etag[:-1] + '-gzip"'
+                variant.last_modified = info.last_modified
+                info.variant = variant
+
+        return info.variant or None
+
+    def compress(self, info, target):
+        """
+        Writes the file described by 'info' gzipped to the path 'target', and
+        returns the result of os.stat for it. Returns None without writing it
+        if it is not smaller than the file itself.
+        """
+
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+
+        # Compress to a temporary file first, so the variant appears at once
+        # and whole even with several requests building it at the same time.
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with open(info.path, 'rb') as source, \
+                    os.fdopen(descriptor, 'wb') as written:
+                with gzip.GzipFile(fileobj=written, mode='wb', mtime=0) as gz:
+                    shutil.copyfileobj(source, gz)
+                length = written.tell()
+
+            if length >= info.size:
+                os.unlink(temporary)
+                return None
+
+            os.utime(temporary, ns=(info.version[0], info.version[0]))
+            os.replace(temporary, target)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+        return os.stat(target)
+
+    def precompress(self):
+        """
+        Builds the precompressed variants of all compressible files below the
+        root directory that are missing or out of date, up front rather than
+        on first access.
+        """
+
+        if self.variants is None:
+            return
+
+        for directory, names, files in os.walk(self.root):
+            # The variants may be kept below the root, but are not compressed.
+            if os.path.join(directory, '').startswith(
+                    os.path.join(self.variants, '')):
+                continue
+
+            for name in files:
+                # Dangling links, pipes and the like are not served, and so
+                # not compressed either.
+                try:
+                    info = self.info(os.path.join(directory, name))
+                except response.HttpNotFoundException:
+                    continue
+
+                if self.compresses(info, self.mimetype(info.path)):
+                    self.variant(info)
+
+    def coding(self, request):
+        """
+        Returns the content coding to serve the response to 'request' in,
+        either gzip or identity.
+        """
+
+        if request.accept_encoding is None:
+            return compression.IDENTITY
+
+        # The precompressed variant is preferred on a tie. Should the client
+        # accept neither, it gets the file as it is.
+        return negotiation.best_offer(
+            request.accept_encoding, (compression.GZIP, compression.IDENTITY)
+        ) or compression.IDENTITY
+
+    def not_modified(self, request, info):
+        """
+        Returns a boolean indicating whether the copy of the file described
+        by 'info' the client has is still up to date.
+        """
+
+        environ = request.environ
+
+        # The entity tag takes precedence over the date -- RFC7232 section 6.
+        if 'HTTP_IF_NONE_MATCH' in environ:
+            return request.etag_matches(info.etag)
+
+        if 'HTTP_IF_MODIFIED_SINCE' in environ:
+            try:
+                since = email.utils.parsedate_to_datetime(
+                    environ['HTTP_IF_MODIFIED_SINCE']
+                )
+            except (TypeError, ValueError):
+                return False  # An invalid date is ignored.
+
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=datetime.timezone.utc)
+
+            return info.mtime <= since.timestamp()
+
+        return False
+
+    def byte_range(self, request, info):
+        """
+        Returns the byte range of the file described by 'info' requested as a
+        pair of its first and last offset, or None if the whole file is to be
+        served. Raises HttpRangeNotSatisfiableException if the range requested
+        lies beyond the end of the file.
+        """
+
+        environ = request.environ
+        header = environ.get('HTTP_RANGE')
+        if header is None:
+            return None
+
+        # A range is only served if the client has the same file in part.
+        if_range = environ.get('HTTP_IF_RANGE')
+        if if_range is not None and \
+                if_range not in (info.etag, info.last_modified):
+            return None
+
+        # Other units, multiple ranges and malformed ones may be ignored, in
+        # which case the whole file is served -- RFC7233 section 3.1.
+        match = RE_RANGE.fullmatch(header.replace(' ', ''))
+        if match is None or not (match.group('first') or match.group('last')):
+            return None
+
+        if match.group('first'):
+            first = int(match.group('first'))
+            last = int(match.group('last') or info.size - 1)
+        else:
+            # A suffix range covers the last bytes of the file.
+            first = max(info.size - int(match.group('last')), 0)
+            last = info.size - 1
+
+        if first >= info.size:
+            raise response.HttpRangeNotSatisfiableException(info.size)
+
+        if last < first:
+            return None
+
+        return first, min(last, info.size - 1)
+
+    def serve(self, path, request, body):
+        """
+        Serves the file at 'path' relative to the root directory in response
+        to 'request', with the file as its body if 'body' is True.
+        """
+
+        info = self.info(self.locate(path))
+        mimetype = self.mimetype(info.path)
+        headers = {}
+
+        # The representation depends on Accept-Encoding for compressible
+        # files, and so do its headers, 304 responses included.
+        if self.compresses(info, mimetype):
+            headers['Vary'] = 'Accept-Encoding'
+            if self.coding(request) is compression.GZIP:
+                variant = self.variant(info)
+                if variant is not None:
+                    headers['Content-Encoding'] = 'gzip'
+                    info = variant
+
+        headers['ETag'] = info.etag
+        headers['Last-Modified'] = info.last_modified
+        headers['Accept-Ranges'] = 'bytes'
+
+        if self.not_modified(request, info):
+            raise response.HttpNotModifiedException(headers)
+
+        status = response.STATUS_OK
+        first, last = 0, info.size - 1
+
+        byte_range = self.byte_range(request, info)
+        if byte_range is not None:
+            status = response.STATUS_PARTIAL_CONTENT
+            first, last = byte_range
+            headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                first, last, info.size
+            )
+
+        length = last - first + 1
+        headers['Content-Length'] = str(length)
+
+        if not body:
+            data = b''
+        elif byte_range is None:
+            # Whole files are handed over as is, so the server may send them
+            # with sendfile and the like.
+            data = open(info.path, 'rb')
+        else:
+            data = FileRange(open(info.path, 'rb'), first, length)
+
+        return response.Response(data, status=status, headers=headers,
+                                 mimetype=mimetype)
+
+    @faucets.raw
+    def get(self, data, path, request):
+        return self.serve(path, request, body=True)
+
+    @faucets.raw
+    def head(self, data, path, request):
+        return self.serve(path, request, body=False)
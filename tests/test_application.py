@@ -0,0 +1,522 @@
+""" Testing module for eupheme.application.
+
+This file contains the testcases used to test how the application dispatches
+WSGI requests to endpoints and serves what they produce.
+
+"""
+
+import gzip
+import io
+import zlib
+
+import eupheme.application as application
+import eupheme.compression as compression
+import eupheme.faucets as faucets
+import eupheme.mime as mime
+import eupheme.negotiation as negotiation
+import eupheme.response as response
+
+
+class TextFaucet(faucets.OutgoingFaucet):
+    """Faucet passing text through as is, chunked or not."""
+
+    mimetypes = {
+        mime.MimeType('text', 'plain')
+    }
+
+    def outgoing(self, flow):
+        return flow.data
+
+
+class Resource:
+    """Resource serving whatever text it was created with."""
+
+    allowed_methods = {'GET'}
+
+    def __init__(self, data):
+        self.data = data
+
+    @faucets.produces('text/plain')
+    def get(self, data, request):
+        return self.data
+
+
+def environ(path='/', **headers):
+    """Builds a minimal WSGI environment for a GET request for 'path'."""
+
+    env = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'HTTP_ACCEPT': 'text/plain',
+        'wsgi.input': io.BytesIO(),
+    }
+    env.update(headers)
+    return env
+
+
+def serve(app, env):
+    """
+    Calls the application 'app' for the environment 'env' and returns its
+    status, headers and list of body chunks.
+    """
+
+    started = {}
+
+    def start_response(status, headers):
+        started['status'] = status
+        started['headers'] = dict(headers)
+
+    # Servers close the body once it is sent, files served included.
+    body = app(env, start_response)
+    try:
+        chunks = list(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+    return started['status'], started['headers'], chunks
+
+
+def make_app(data=None, resource=None, faucet=None, compress=False,
+             clock=None):
+    """
+    Creates an application serving 'resource', or else 'data' as text, on '/'
+    through the outgoing faucet 'faucet', a TextFaucet if not given. With
+    'compress' set, text of at least 16 bytes is compressed in the gzip or
+    deflate coding. The callable 'clock' replaces that of the response cache.
+    """
+
+    app = application.Application()
+    app.faucets.add_outgoing(faucet or TextFaucet())
+    app.routes.add('^/$', resource or Resource(data))
+
+    if compress:
+        app.compressor = compression.Compressor({'text/plain'}, 16)
+        app.broker = negotiation.Broker(
+            app.broker.charsets,
+            app.broker.default_charset,
+            app.broker.methods,
+            app.broker.default_mimetype,
+            codings=(compression.GZIP, mime.ContentCoding('deflate'),
+                     compression.IDENTITY)
+        )
+
+    if clock is not None:
+        app.responses.clock = clock
+
+    return app
+
+
+def test_serve_string():
+    """Text rendered in full is encoded in one go."""
+
+    status, headers, chunks = serve(make_app('ニャー'), environ())
+
+    assert status == '200 OK'
+    assert headers['Content-Type'] == 'text/plain; charset=utf-8'
+    assert chunks == ['ニャー'.encode('utf-8')]
+
+
+def test_serve_chunks():
+    """Chunks of text are encoded and yielded as they are produced."""
+
+    produced = []
+
+    def generate():
+        for chunk in ('one ', 'two ', 'three'):
+            produced.append(chunk)
+            yield chunk
+
+    app = make_app(generate())
+    started = []
+    body = app(environ(), lambda status, headers: started.append(status))
+
+    assert next(body) == b'one '
+    assert produced == ['one ']
+    assert list(body) == [b'two ', b'three']
+    assert started == ['200 OK']
+
+
+def test_serve_chunks_stateful_encoding():
+    """Chunks share one encoder, writing a byte order mark only once."""
+
+    app = make_app(iter(['ab', 'cd']))
+    app.broker.charsets = {mime.CharacterSet('utf-16')}
+
+    status, headers, chunks = serve(
+        app, environ(HTTP_ACCEPT_CHARSET='utf-16')
+    )
+
+    assert b''.join(chunks).decode('utf-16') == 'abcd'
+
+
+def test_not_found():
+    """Requests for unknown paths are answered with 404 and no body."""
+
+    status, headers, chunks = serve(make_app('text'), environ('/missing'))
+
+    assert status == '404 Not Found'
+    assert chunks == []
+
+
+def test_prepare():
+    """Preparing compiles the routes and preloads the outgoing faucets."""
+
+    preloaded = []
+
+    class PreloadingFaucet(TextFaucet):
+        def preload(self, endpoints):
+            preloaded.extend(endpoints)
+
+    resource = Resource('text')
+    app = make_app(resource=resource, faucet=PreloadingFaucet())
+    app.prepare()
+
+    assert app.routes.table is not None
+    assert preloaded == [resource.get]
+
+
+class Echo:
+    """Resource echoing the JSON document posted to it as text."""
+
+    allowed_methods = {'POST'}
+
+    @faucets.consumes('application/json')
+    @faucets.produces('text/plain')
+    def post(self, data, request):
+        return repr(data)
+
+
+class UnreadableInput:
+    """Request body that must not be read."""
+
+    def read(self, *args):
+        raise AssertionError('Request body read')
+
+
+def test_incoming_charset_parameter():
+    """Entities are accepted by type, whatever their parameters."""
+
+    app = make_app('text')
+    app.faucets.add_incoming(faucets.JsonIncomingFaucet())
+    app.routes.add('^/echo$', Echo())
+
+    body = '["ニャー"]'.encode('utf-8')
+    status, headers, chunks = serve(app, environ(
+        '/echo',
+        REQUEST_METHOD='POST',
+        CONTENT_TYPE='application/json; charset=utf-8',
+        CONTENT_LENGTH=str(len(body)),
+        **{'wsgi.input': io.BytesIO(body)}
+    ))
+
+    assert status == '200 OK'
+    assert chunks == [repr(['ニャー']).encode('utf-8')]
+
+
+def test_incoming_too_large():
+    """Entities too large for their faucet are rejected without reading."""
+
+    app = make_app('text')
+    app.faucets.add_incoming(faucets.JsonIncomingFaucet(max_length=16))
+    app.routes.add('^/echo$', Echo())
+
+    status, headers, chunks = serve(app, environ(
+        '/echo',
+        REQUEST_METHOD='POST',
+        CONTENT_TYPE='application/json',
+        CONTENT_LENGTH='17',
+        **{'wsgi.input': UnreadableInput()}
+    ))
+
+    assert status == '413 Request Entity Too Large'
+
+
+class Image:
+    """Resource serving whatever binary data it was created with."""
+
+    allowed_methods = {'GET'}
+
+    def __init__(self, data):
+        self.data = data
+
+    @faucets.produces('image/png')
+    def get(self, data, request):
+        return self.data
+
+
+def test_serve_binary():
+    """Buffers are served as is, without a charset."""
+
+    for data in (b'\x89PNG', bytearray(b'\x89PNG'),
+                 memoryview(b'..\x89PNG')[2:]):
+        app = make_app(resource=Image(data),
+                       faucet=faucets.BinaryFaucet('image/png'))
+        status, headers, chunks = serve(app, environ(HTTP_ACCEPT='image/*'))
+
+        assert headers['Content-Type'] == 'image/png'
+        assert headers['Content-Length'] == '4'
+        assert chunks == [b'\x89PNG']
+
+
+def test_serve_file():
+    """Files are served in blocks, or by the server's file wrapper."""
+
+    image = io.BytesIO(b'..\x89PNG')
+    image.seek(2)
+    app = make_app(resource=Image(image),
+                   faucet=faucets.BinaryFaucet('image/png'))
+    app.block_size = 3
+    status, headers, chunks = serve(app, environ(HTTP_ACCEPT='image/png'))
+
+    assert headers['Content-Length'] == '4'
+    assert chunks == [b'\x89PN', b'G']
+    assert image.closed
+
+    wrapped = []
+
+    def file_wrapper(file, block_size):
+        wrapped.append((file, block_size))
+        return [file.read()]
+
+    image = io.BytesIO(b'\x89PNG')
+    app = make_app(resource=Image(image),
+                   faucet=faucets.BinaryFaucet('image/png'))
+    status, headers, chunks = serve(app, environ(
+        HTTP_ACCEPT='image/png', **{'wsgi.file_wrapper': file_wrapper}
+    ))
+
+    assert wrapped == [(image, app.block_size)]
+    assert chunks == [b'\x89PNG']
+
+
+def test_compress_full():
+    """Output rendered in full is compressed when long enough."""
+
+    text = 'ニャー' * 20
+    app = make_app(text, compress=True)
+
+    status, headers, chunks = serve(app, environ(
+        HTTP_ACCEPT_ENCODING='deflate;q=0.5, gzip'
+    ))
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Vary'] == 'Accept, Accept-Charset, Accept-Encoding'
+    assert headers['Content-Length'] == str(len(chunks[0]))
+    assert gzip.decompress(b''.join(chunks)) == text.encode('utf-8')
+
+    # Short output is not worth compressing, but could have been.
+    status, headers, chunks = serve(make_app('short', compress=True), environ(
+        HTTP_ACCEPT_ENCODING='gzip'
+    ))
+    assert 'Content-Encoding' not in headers
+    assert 'Accept-Encoding' in headers['Vary']
+    assert chunks == [b'short']
+
+
+def test_compress_content_length():
+    """The length of a compressed body replaces the one the endpoint set."""
+
+    text = 'ニャー' * 20
+    app = make_app(response.Response(
+        text, headers={'Content-Length': str(len(text))}
+    ), compress=True)
+
+    status, headers, chunks = serve(app, environ(
+        HTTP_ACCEPT_ENCODING='gzip'
+    ))
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Content-Length'] == str(len(chunks[0]))
+
+    app = make_app(response.Response(
+        iter([text]), headers={'Content-Length': str(len(text))}
+    ), compress=True)
+    status, headers, chunks = serve(app, environ(
+        HTTP_ACCEPT_ENCODING='gzip'
+    ))
+    assert 'Content-Length' not in headers
+
+
+def test_compress_chunks():
+    """Chunked output is compressed chunk by chunk, whatever its length."""
+
+    app = make_app(iter(['one ', 'two ', 'three']), compress=True)
+    status, headers, chunks = serve(app, environ(
+        HTTP_ACCEPT_ENCODING='deflate'
+    ))
+
+    assert headers['Content-Encoding'] == 'deflate'
+    assert 'Content-Length' not in headers
+    assert zlib.decompress(b''.join(chunks)) == b'one two three'
+
+    # Every chunk can be decompressed as soon as it arrives.
+    decompressor = zlib.decompressobj()
+    decompressed = [decompressor.decompress(chunk) for chunk in chunks]
+    assert decompressed[:3] == [b'one ', b'two ', b'three']
+
+
+def test_compress_not_allowed():
+    """Types left out of the allow list are neither compressed nor varied."""
+
+    app = make_app('ニャー' * 20, compress=True)
+    app.compressor.mimetypes = set()
+
+    status, headers, chunks = serve(app, environ(
+        HTTP_ACCEPT_ENCODING='gzip'
+    ))
+    assert 'Content-Encoding' not in headers
+    assert 'Accept-Encoding' not in headers['Vary']
+
+
+class Versioned:
+    """Resource counting how often it renders its validated text."""
+
+    allowed_methods = {'GET'}
+
+    def __init__(self, version):
+        self.version = version
+        self.rendered = 0
+
+    def current(self, request):
+        return self.version
+
+    @faucets.etag(version=current, weak=True)
+    @faucets.produces('text/plain')
+    def get(self, data, request):
+        self.rendered += 1
+        return 'version {0}'.format(self.version)
+
+
+class Validated(Resource):
+    """Resource serving its text validated by a hash of the body."""
+
+    @faucets.etag()
+    @faucets.produces('text/plain')
+    def get(self, data, request):
+        return self.data
+
+
+def test_etag_body():
+    """Bodies of validated endpoints are hashed to a strong ETag."""
+
+    resource = Validated('text')
+    app = make_app(resource=resource)
+
+    status, headers, chunks = serve(app, environ())
+    etag = headers['ETag']
+    assert status == '200 OK' and etag.startswith('"')
+
+    status, headers, chunks = serve(app, environ(
+        HTTP_IF_NONE_MATCH='"other", ' + etag
+    ))
+    assert status == '304 Not Modified'
+    assert headers['ETag'] == etag
+    assert headers['Vary'] == 'Accept, Accept-Charset'
+    assert chunks == []
+
+    # A different body has a different tag.
+    resource.data = 'other text'
+    status, headers, chunks = serve(app, environ(HTTP_IF_NONE_MATCH=etag))
+    assert status == '200 OK' and headers['ETag'] != etag
+
+
+def test_etag_version():
+    """Version keys tag representations without rendering them."""
+
+    resource = Versioned(1)
+    app = make_app(resource=resource)
+
+    status, headers, chunks = serve(app, environ())
+    etag = headers['ETag']
+    assert etag.startswith('W/"') and chunks == [b'version 1']
+
+    status, headers, chunks = serve(app, environ(HTTP_IF_NONE_MATCH=etag))
+    assert status == '304 Not Modified' and chunks == []
+    assert resource.rendered == 1
+
+    # Other representations of the same version are tagged differently.
+    status, headers, chunks = serve(app, environ(HTTP_ACCEPT_CHARSET='ascii'))
+    assert headers['ETag'] != etag
+
+    resource.version = 2
+    status, headers, chunks = serve(app, environ(HTTP_IF_NONE_MATCH=etag))
+    assert status == '200 OK' and chunks == [b'version 2']
+    assert resource.rendered == 3
+
+
+class Cached:
+    """Resource counting how often it renders its cached text."""
+
+    allowed_methods = {'GET'}
+
+    def __init__(self):
+        self.rendered = 0
+
+    @faucets.cached(60)
+    @faucets.produces('text/plain')
+    def get(self, data, request):
+        self.rendered += 1
+        return 'rendered {0} for {1}'.format(self.rendered,
+                                             request.query_string)
+
+
+def test_cache_response():
+    """Responses are cached by path, query and representation."""
+
+    resource = Cached()
+    now = [0]
+    app = make_app(resource=resource, clock=lambda: now[0])
+
+    status, first, chunks = serve(app, environ())
+    assert chunks == [b'rendered 1 for ']
+
+    now[0] = 10
+    status, headers, chunks = serve(app, environ())
+    assert chunks == [b'rendered 1 for '] and resource.rendered == 1
+    assert headers['Age'] == '10'
+    assert headers['Content-Type'] == first['Content-Type']
+
+    # Other queries and representations are cached on their own.
+    status, headers, chunks = serve(app, environ(QUERY_STRING='page=2'))
+    assert chunks == [b'rendered 2 for page=2']
+    status, headers, chunks = serve(app, environ(HTTP_ACCEPT_CHARSET='ascii'))
+    assert chunks == [b'rendered 3 for ']
+
+    # Expired responses are rendered again.
+    now[0] = 61
+    status, headers, chunks = serve(app, environ())
+    assert chunks == [b'rendered 4 for '] and 'Age' not in headers
+
+
+def test_cache_control():
+    """Cache-Control request directives are honoured."""
+
+    resource = Cached()
+    now = [0]
+    app = make_app(resource=resource, clock=lambda: now[0])
+    serve(app, environ())
+    now[0] = 30
+
+    status, headers, chunks = serve(app, environ(
+        HTTP_CACHE_CONTROL='max-age=10'
+    ))
+    assert chunks == [b'rendered 2 for ']
+
+    # A response rendered anew replaces the cached one.
+    status, headers, chunks = serve(app, environ(HTTP_PRAGMA='no-cache'))
+    assert chunks == [b'rendered 3 for ']
+
+    status, headers, chunks = serve(app, environ(
+        HTTP_CACHE_CONTROL='max-age=10'
+    ))
+    assert chunks == [b'rendered 3 for ']
+
+    status, headers, chunks = serve(app, environ(
+        HTTP_CACHE_CONTROL='min-fresh=61'
+    ))
+    assert chunks == [b'rendered 4 for ']
+
+    # Responses to no-store requests are not stored either.
+    app.responses.clear()
+    serve(app, environ(HTTP_CACHE_CONTROL='no-store'))
+    status, headers, chunks = serve(app, environ())
+    assert chunks == [b'rendered 6 for ']
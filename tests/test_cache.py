@@ -0,0 +1,67 @@
+""" Testing module for eupheme.cache.
+
+This file contains the testcases used to test the bounds, eviction order and
+statistics of the caches in Eupheme.
+
+"""
+
+import eupheme.cache as cache
+
+
+def test_lru_eviction():
+    """The least recently used entry is evicted first."""
+
+    lru = cache.LruCache(2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    assert lru.get('a') == 1
+
+    lru.put('c', 3)
+    assert 'a' in lru and 'c' in lru and 'b' not in lru
+    assert lru.get('b') is None
+    assert lru.hits == 1 and lru.misses == 1
+
+
+def test_lru_disabled():
+    """A cache of size zero stores nothing."""
+
+    lru = cache.LruCache(0)
+    lru.put('a', 1)
+    assert len(lru) == 0
+
+
+def test_expiring_bytes():
+    """Entries are evicted to keep the total size within bounds."""
+
+    expiring = cache.ExpiringCache(10, 100)
+    expiring.put('a', 'a', size=40)
+    expiring.put('b', 'b', size=40)
+    assert expiring.bytes == 80
+
+    expiring.put('c', 'c', size=40)
+    assert 'a' not in expiring and expiring.bytes == 80
+
+    # Replacing an entry accounts for the size of the old value.
+    expiring.put('c', 'c', size=10)
+    assert expiring.bytes == 50
+
+    # Values larger than the cache are not stored.
+    expiring.put('d', 'd', size=101)
+    assert 'd' not in expiring
+
+
+def test_expiring_ttl():
+    """Entries are not returned once their time to live has passed."""
+
+    now = [0]
+    expiring = cache.ExpiringCache(10, 100, clock=lambda: now[0])
+    expiring.put('a', 'a', size=1, ttl=5)
+    expiring.put('b', 'b', size=1)
+
+    now[0] = 4
+    assert expiring.get('a') == 'a'
+
+    now[0] = 5
+    assert expiring.get('a') is None
+    assert expiring.get('b') == 'b'
+    assert expiring.bytes == 1
@@ -1,4 +1,3 @@
-import decimal
 import nose
 
 import eupheme.mime as mime
@@ -23,7 +22,7 @@ def test_charset_parse():
 
     parsed = mime.CharacterSet.parse('utf-8; q=0.5')
     assert parsed.codec.name == 'utf-8'
-    assert parsed.quality == decimal.Decimal('0.5')
+    assert parsed.quality == 500
     assert parsed in utf8
     assert utf8 in parsed
 
@@ -61,3 +60,11 @@ def test_charset_negotiate():
 
     # Only UTF-8 is requested, and it is available.
     assert broker.best_offer([utf8], [utf8, ascii]) is utf8
+
+
+def test_charset_interned():
+    """Character sets parsed from strings are interned by codec name."""
+
+    assert mime.CharacterSet.parse('UTF8') is mime.CharacterSet.parse('utf-8')
+    assert mime.CharacterSet.parse('utf-8') == utf8
+    assert mime.CharacterSet.parse('utf-8; q=0.5') != utf8
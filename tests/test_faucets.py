@@ -5,10 +5,15 @@ various faucets used in Eupheme.
 
 """
 
+import eupheme.cache as cache
 import eupheme.faucets as faucets
 import eupheme.mime as mime
+import eupheme.response as response
 
 import nose
+import os
+import tempfile
+import urllib.parse
 from json import loads
 
 
@@ -192,3 +197,449 @@ def test_jsonfaucet_encoder_exception():
     )
 
     print(result)
+
+
+def test_jinjafaucet_stream():
+    """Test if JinjaFaucet renders piecemeal when streaming.
+
+    Determines if the streamed pieces add up to the page rendered in full,
+    with and without buffering, and if the default template is used when
+    the endpoint specifies none.
+
+    """
+
+    @faucets.template('test_template.html')
+    def test():
+        pass
+
+    data = {'data': 'Some test data', 'ニャー': 'Nyaa~'}
+    flow = faucets.Flow(faucets.Flow.OUT, data, endpoint=test)
+    rendered = faucets.JinjaFaucet('tests/').outgoing(flow)
+
+    for buffer_size in (None, 0, 1, 2):
+        jinja = faucets.JinjaFaucet(
+            'tests/', stream=True, buffer_size=buffer_size
+        )
+        result = jinja.outgoing(flow)
+
+        assert not isinstance(result, str)
+        assert ''.join(result) == rendered
+
+    def untemplated():
+        pass
+
+    jinja = faucets.JinjaFaucet('tests/', stream=True)
+    result = jinja.outgoing(
+        faucets.Flow(faucets.Flow.OUT, data, endpoint=untemplated)
+    )
+
+    assert 'Default template' in ''.join(result)
+
+
+def test_jinjafaucet_preload():
+    """Test if JinjaFaucet compiles templates ahead of time.
+
+    Determines if preloading compiles the templates of the endpoints given
+    and the default template into the shared bytecode cache.
+
+    """
+
+    @faucets.template('test_template.html')
+    def test():
+        pass
+
+    def untemplated():
+        pass
+
+    with tempfile.TemporaryDirectory() as cache:
+        jinja = faucets.JinjaFaucet(
+            'tests/', bytecode_cache=cache, auto_reload=False
+        )
+        jinja.preload([test, untemplated])
+
+        assert not jinja.environment.auto_reload
+        assert len(os.listdir(cache)) == 2
+
+        # Another worker sharing the cache finds the compiled templates.
+        other = faucets.JinjaFaucet('tests/', bytecode_cache=cache)
+        other.preload([test])
+        assert len(os.listdir(cache)) == 2
+
+
+def test_jinjafaucet_fragment_cache():
+    """Test if JinjaFaucet caches fragments in {% cache %} tags.
+
+    Determines if cached fragments are reused on later renders, and if they
+    are rendered anew once their time to live has passed.
+
+    """
+
+    @faucets.template('test_fragment.html')
+    def test():
+        pass
+
+    now = [0]
+    fragments = cache.ExpiringCache(16, 4096, clock=lambda: now[0])
+    jinja = faucets.JinjaFaucet('tests/', fragment_cache=fragments)
+
+    def render(value):
+        return jinja.outgoing(faucets.Flow(
+            faucets.Flow.OUT,
+            {'navigation': value, 'footer': value, 'data': value, 'ttl': 60},
+            endpoint=test
+        ))
+
+    first = render('first')
+    assert '<nav>first</nav>' in first and '<footer>first</footer>' in first
+
+    second = render('second')
+    assert '<nav>first</nav>' in second
+    assert '<footer>first</footer>' in second
+    assert '<main>second</main>' in second
+    assert fragments.hits == 2 and fragments.misses == 2
+
+    # The navigation expires, the footer is cached indefinitely.
+    now[0] = 61
+    third = render('third')
+    assert '<nav>third</nav>' in third
+    assert '<footer>first</footer>' in third
+
+
+def test_jsonfaucet_stream():
+    """ Test if the JsonFaucet streams generators element by element. """
+    produced = []
+
+    def records():
+        for i in range(3):
+            produced.append(i)
+            yield {'id': i, 'obj': A()}
+
+    jsonf = faucets.JsonFaucet()
+    result = jsonf.outgoing(faucets.Flow(faucets.Flow.OUT, records()))
+
+    assert not isinstance(result, str)
+    assert next(result) == '['
+    assert produced == []
+
+    first = next(result)
+    assert produced == [0]
+    assert loads(first) == {'id': 0, 'obj': {'a': 'test', 'b': 'test2'}}
+
+    rest = ''.join(result)
+    assert produced == [0, 1, 2]
+    assert len(loads('[' + first + rest)) == 3
+
+
+def test_jsonfaucet_stream_nested():
+    """ Test if the JsonFaucet streams collections within dictionaries. """
+    jsonf = faucets.JsonFaucet(stream_threshold=3)
+    data = {
+        'count': 4,
+        'items': iter(range(4)),
+        'tags': ['a', 'b', 'c'],
+        1: A(),
+    }
+
+    result = jsonf.outgoing(faucets.Flow(faucets.Flow.OUT, data))
+
+    assert not isinstance(result, str)
+    assert loads(''.join(result)) == {
+        'count': 4,
+        'items': [0, 1, 2, 3],
+        'tags': ['a', 'b', 'c'],
+        '1': {'a': 'test', 'b': 'test2'},
+    }
+
+
+def test_jsonfaucet_small_list():
+    """ Test if the JsonFaucet encodes small lists in one go. """
+    jsonf = faucets.JsonFaucet()
+    result = jsonf.outgoing(faucets.Flow(faucets.Flow.OUT, [1, 2, 3]))
+
+    assert result == '[1, 2, 3]'
+
+
+def test_ndjsonfaucet():
+    """ Test if the NdjsonFaucet sends a line per record as produced. """
+    produced = []
+
+    def records():
+        for i in range(2):
+            produced.append(i)
+            yield {'id': i, 'obj': A()}
+
+    ndjson = faucets.NdjsonFaucet()
+    result = ndjson.outgoing(faucets.Flow(faucets.Flow.OUT, records()))
+
+    line = next(result)
+    assert produced == [0]
+    assert line.endswith('\n') and loads(line)['obj']['a'] == 'test'
+    assert [loads(line)['id'] for line in result] == [1]
+
+
+def test_eventstreamfaucet():
+    """ Test if the EventStreamFaucet encodes records as events. """
+    now = [0]
+
+    def records():
+        yield 'hello\nworld'
+        yield None
+        now[0] = 20
+        yield None
+        yield faucets.Event({'a': 1}, event='update', id=7, retry=1000)
+
+    sse = faucets.EventStreamFaucet(keepalive=15, clock=lambda: now[0])
+    result = list(sse.outgoing(faucets.Flow(faucets.Flow.OUT, records())))
+
+    assert result == [
+        'data: hello\ndata: world\n\n',
+        ': keepalive\n\n',
+        'event: update\nid: 7\nretry: 1000\ndata: {"a": 1}\n\n',
+    ]
+
+
+def test_eventstreamfaucet_line_breaks():
+    """ Test if the EventStreamFaucet splits data on line breaks only. """
+    sse = faucets.EventStreamFaucet()
+
+    assert sse.encode('a\x0cb\u2028c') == 'data: a\x0cb\u2028c\n\n'
+    assert sse.encode('a\r\nb\rc\n') == \
+        'data: a\ndata: b\ndata: c\ndata: \n\n'
+    assert sse.encode('') == 'data: \n\n'
+
+
+def test_eventstreamfaucet_field_injection():
+    """ Test if the EventStreamFaucet rejects fields spanning lines. """
+    sse = faucets.EventStreamFaucet()
+
+    for event in (faucets.Event('x', event='evil\ndata: injected'),
+                  faucets.Event('x', id='1\r\nretry: 0'),
+                  faucets.Event('x', id='1\0')):
+        try:
+            sse.encode(event)
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError not raised'
+
+
+def test_jsonincomingfaucet():
+    """ Test if the JsonIncomingFaucet honours the charset parameter. """
+    json = faucets.JsonIncomingFaucet()
+
+    result = json.incoming(faucets.Flow(
+        faucets.Flow.IN, '{"ニャー": [1, 2]}'.encode('utf-8')
+    ))
+    assert result == {'ニャー': [1, 2]}
+
+    latin = mime.MimeType.parse('application/json; charset=latin-1')
+    result = json.incoming(faucets.Flow(
+        faucets.Flow.IN, '["café"]'.encode('latin-1'), mimetype=latin
+    ))
+    assert result == ['café']
+
+
+@nose.tools.raises(response.HttpRequestEntityTooLargeException)
+def test_jsonincomingfaucet_too_large():
+    """ Test if the JsonIncomingFaucet rejects documents too large. """
+    json = faucets.JsonIncomingFaucet(max_length=8)
+    json.incoming(faucets.Flow(faucets.Flow.IN, b'[1, 2, 3, 4]'))
+
+
+def test_jsonincomingfaucet_depth():
+    """ Test if the JsonIncomingFaucet limits nesting depth. """
+    json = faucets.JsonIncomingFaucet(max_depth=4)
+
+    # Brackets within strings do not count.
+    document = b'[[["[[[", {"a": "]]]{{{"}]]]'
+    assert json.incoming(faucets.Flow(faucets.Flow.IN, document)) == \
+        [[['[[[', {'a': ']]]{{{'}]]]
+
+    try:
+        json.incoming(faucets.Flow(faucets.Flow.IN, b'[[[[[1]]]]]'))
+    except response.HttpBadRequestException:
+        pass
+    else:
+        assert False, 'HttpBadRequestException not raised'
+
+
+@nose.tools.raises(response.HttpBadRequestException)
+def test_jsonincomingfaucet_malformed():
+    """ Test if the JsonIncomingFaucet rejects malformed documents. """
+    json = faucets.JsonIncomingFaucet()
+    json.incoming(faucets.Flow(faucets.Flow.IN, b'{"a": '))
+
+
+MULTIPART = (
+    b'preamble\r\n'
+    b'--xyz\r\n'
+    b'Content-Disposition: form-data; name="_charset_"\r\n'
+    b'\r\n'
+    b'latin-1\r\n'
+    b'--xyz\r\n'
+    b'Content-Disposition: form-data; name="title"\r\n'
+    b'\r\n'
+    b'caf\xe9\r\n--xy\r\n'
+    b'--xyz\r\n'
+    b'Content-Disposition: form-data; name="file"; filename="a.txt"\r\n'
+    b'Content-Type: text/plain\r\n'
+    b'\r\n'
+) + b'0123456789' * 10 + b'\r\n--xyz--\r\nepilogue'
+
+
+def multipart_flow(chunks, boundary='xyz'):
+    """ Builds an incoming flow of multipart data in 'chunks'. """
+    mimetype = mime.MimeType.parse(
+        'multipart/form-data; boundary={0}'.format(boundary)
+    )
+    return faucets.Flow(faucets.Flow.IN, chunks, mimetype=mimetype)
+
+
+def test_multipartfaucet():
+    """ Test if the MultipartFaucet parses fields and files in chunks. """
+    multipart = faucets.MultipartFaucet(memory_threshold=1024)
+
+    # Boundaries split across chunks are found all the same.
+    for size in range(1, 12):
+        chunks = [MULTIPART[i:i + size]
+                  for i in range(0, len(MULTIPART), size)]
+        result = multipart.incoming(multipart_flow(chunks))
+
+        assert result['title'] == ['café\r\n--xy']
+        upload, = result['file']
+        assert upload.filename == 'a.txt'
+        assert upload.content_type == 'text/plain'
+        assert upload.file.read() == b'0123456789' * 10
+        upload.file.close()
+
+
+def test_multipartfaucet_spooling():
+    """ Test if the MultipartFaucet spools large files to disk. """
+    multipart = faucets.MultipartFaucet(memory_threshold=50)
+    result = multipart.incoming(multipart_flow(MULTIPART))
+
+    upload, = result['file']
+    assert upload.file._rolled
+    assert upload.file.read() == b'0123456789' * 10
+    upload.file.close()
+
+
+def test_multipartfaucet_filename():
+    """ Test if the MultipartFaucet takes file names as browsers send them. """
+    multipart = faucets.MultipartFaucet()
+
+    for filename, expected in ((b'caf\xc3\xa9.txt', 'café.txt'),
+                               (b'r\xc3\xa9sum\xc3\xa9 \\"1\\".pdf',
+                                'résumé "1".pdf'),
+                               (b'\xe6\x97\xa5\xe6\x9c\xac.txt',
+                                '日本.txt')):
+        entity = (
+            b'--xyz\r\n'
+            b'Content-Disposition: form-data; name=file; filename="' +
+            filename + b'"\r\n'
+            b'\r\n'
+            b'data\r\n--xyz--\r\n'
+        )
+        upload, = multipart.incoming(multipart_flow([entity]))['file']
+        assert upload.filename == expected
+        upload.file.close()
+
+
+@nose.tools.raises(response.HttpBadRequestException)
+def test_multipartfaucet_incomplete():
+    """ Test if the MultipartFaucet rejects entities cut short. """
+    multipart = faucets.MultipartFaucet()
+    multipart.incoming(multipart_flow([MULTIPART[:-20]]))
+
+
+@nose.tools.raises(response.HttpBadRequestException)
+def test_multipartfaucet_no_boundary():
+    """ Test if the MultipartFaucet requires a boundary. """
+    multipart = faucets.MultipartFaucet()
+    multipart.incoming(faucets.Flow(
+        faucets.Flow.IN, MULTIPART,
+        mimetype=mime.MimeType.parse('multipart/form-data')
+    ))
+
+
+@nose.tools.raises(response.HttpRequestEntityTooLargeException)
+def test_multipartfaucet_field_too_large():
+    """ Test if the MultipartFaucet limits the length of fields. """
+    multipart = faucets.MultipartFaucet(max_field_length=4)
+    multipart.incoming(multipart_flow([MULTIPART]))
+
+
+@nose.tools.raises(response.HttpRequestEntityTooLargeException)
+def test_multipartfaucet_too_many_parts():
+    """ Test if the MultipartFaucet limits the number of parts. """
+    multipart = faucets.MultipartFaucet()
+    multipart.max_parts = 2
+    multipart.incoming(multipart_flow([MULTIPART]))
+
+
+def test_multipartfaucet_memory():
+    """ Test if the MultipartFaucet bounds the memory all parts take. """
+
+    # The fields take 17 bytes, leaving too little for the file.
+    multipart = faucets.MultipartFaucet(max_memory=100)
+    upload, = multipart.incoming(multipart_flow([MULTIPART]))['file']
+    assert upload.file._rolled
+    assert upload.file.read() == b'0123456789' * 10
+    upload.file.close()
+
+    multipart = faucets.MultipartFaucet(max_memory=120)
+    upload, = multipart.incoming(multipart_flow([MULTIPART]))['file']
+    assert not upload.file._rolled
+    upload.file.close()
+
+    # Fields cannot be moved to disk, so they are rejected.
+    multipart = faucets.MultipartFaucet(max_memory=10)
+    try:
+        multipart.incoming(multipart_flow([MULTIPART]))
+    except response.HttpRequestEntityTooLargeException:
+        pass
+    else:
+        assert False, 'HttpRequestEntityTooLargeException not raised'
+
+
+def test_formfaucet_charset():
+    """ Test if FormFaucet decodes the form in the charset it names. """
+    formfaucet = faucets.FormFaucet()
+    result = formfaucet.incoming(faucets.Flow(
+        faucets.Flow.IN, b'name=caf%E9+au+lait&_charset_=iso-8859-1'
+    ))
+
+    assert result['name'] == ['café au lait']
+    assert result['_charset_'] == ['iso-8859-1']
+
+
+def test_formfaucet_same_as_parse_qs():
+    """ Test if FormFaucet parses forms as parse_qs does. """
+    formfaucet = faucets.FormFaucet()
+    forms = [
+        b'', b'&&', b'a', b'a=', b'=b', b'a=b=c', b'a=1&a=2&b=%20+%2B',
+        b'%E3%83%8B=%E3%83%A3&bad=%ZZ&partial=%E3',
+    ]
+
+    for form in forms:
+        result = formfaucet.incoming(faucets.Flow(faucets.Flow.IN, form))
+        assert result == urllib.parse.parse_qs(form.decode('ascii')), form
+
+
+def test_formfaucet_limits():
+    """ Test if FormFaucet limits the number and length of fields. """
+    formfaucet = faucets.FormFaucet()
+    formfaucet.max_fields = 2
+    formfaucet.max_field_length = 8
+
+    assert formfaucet.incoming(
+        faucets.Flow(faucets.Flow.IN, b'a=1&b=1234')
+    ) == {'a': ['1'], 'b': ['1234']}
+
+    for form in (b'a=1&b=2&c=3', b'a=12345678'):
+        try:
+            formfaucet.incoming(faucets.Flow(faucets.Flow.IN, form))
+        except response.HttpRequestEntityTooLargeException:
+            pass
+        else:
+            assert False, 'HttpRequestEntityTooLargeException not raised'
@@ -58,3 +58,34 @@ def test_mimeparameter_linefeed():
     """Lonely linefeeds are forbidden in tokens."""
 
     mime.MimeParameters('foo=bar\rbaz')
+
+
+def test_mimeparameter_quoted_separator():
+    """Separators within quoted strings do not end the parameter."""
+
+    parsed = mime.MimeParameters('foo="a; b=c"; asd=qwe')
+    assert parsed['foo'] == 'a; b=c'
+    assert parsed['asd'] == 'qwe'
+    assert len(parsed) == 2
+
+
+@nose.tools.raises(ValueError)
+def test_mimeparameter_unterminated():
+    """Quoted strings must be terminated."""
+
+    mime.MimeParameters('foo="bar')
+
+
+@nose.tools.raises(ValueError)
+def test_mimeparameter_trailing_garbage():
+    """Nothing but whitespace may follow a quoted string."""
+
+    mime.MimeParameters('foo="bar"baz')
+
+
+@nose.tools.raises(ValueError)
+def test_mimeparameter_too_many():
+    """The number of parameters parsed is limited."""
+
+    count = mime.MimeParameters.max_parameters + 1
+    mime.MimeParameters('; '.join('p{0}=v'.format(i) for i in range(count)))
@@ -1,4 +1,3 @@
-import decimal
 import nose
 
 import eupheme.mime as mime
@@ -58,8 +57,8 @@ def test_mimetype_quality_property():
 
     parsed = mime.MimeType.parse('text/plain; q=0.5')
     assert parsed.type == 'text' and parsed.subtype == 'plain'
-    assert isinstance(parsed.quality, decimal.Decimal)
-    assert parsed.quality == decimal.Decimal('0.5')
+    assert isinstance(parsed.quality, int)
+    assert parsed.quality == 500
 
 
 def test_mimetype_encode():
@@ -71,3 +70,84 @@ def test_mimetype_encode():
     # Python dictionaries do not guarantee order, check for alternatives.
     assert (str(mimetype) == 'text/plain; foo=bar; level=1' or
             str(mimetype) == 'text/plain; level=1; foo=bar')
+
+
+def test_mimetype_quality_thousandths():
+    """Quality values are parsed into integer thousandths."""
+
+    assert mime.MimeType.parse('text/plain').quality == 1000
+    assert mime.MimeType.parse('text/plain; q=0').quality == 0
+    assert mime.MimeType.parse('text/plain; q=0.25').quality == 250
+    assert mime.MimeType.parse('text/plain; q=0.001').quality == 1
+    assert mime.MimeType.parse('text/plain; q=1.000').quality == 1000
+
+
+@nose.tools.raises(ValueError)
+def test_mimetype_quality_too_precise():
+    """Quality values with more than three decimals are rejected."""
+
+    mime.MimeType.parse('text/plain; q=0.0001')
+
+
+@nose.tools.raises(ValueError)
+def test_mimetype_quality_out_of_range():
+    """Quality values above one are rejected."""
+
+    mime.MimeType.parse('text/plain; q=1.5')
+
+
+def test_mimetype_interned():
+    """Equal mime types parsed from strings are the same instance."""
+
+    first = mime.MimeType.parse('text/html; level=1')
+    second = mime.MimeType.parse('text/html;level=1')
+
+    assert first is second
+    assert first == mime.MimeType('text', 'html', level=1)
+    assert hash(first) == hash(mime.MimeType('text', 'html', level=1))
+
+
+def test_mimetype_quality_distinguishes():
+    """Mime types differing in quality only are not equal."""
+
+    assert mime.MimeType.parse('text/html; q=0.5') != \
+        mime.MimeType.parse('text/html')
+
+
+@nose.tools.raises(AttributeError)
+def test_mimetype_immutable():
+    """Mime types cannot be changed once created."""
+
+    mimetype = mime.MimeType('text', 'plain')
+    mimetype.subtype = 'html'
+
+
+@nose.tools.raises(TypeError)
+def test_mimeparameters_immutable():
+    """Mime type parameters cannot be changed once created."""
+
+    mimetype = mime.MimeType('text', 'plain', level=1)
+    mimetype.parameters.values['level'] = '2'
+
+
+def test_mimetype_slash_in_parameter():
+    """Slashes in parameter values do not confuse the type and subtype."""
+
+    parsed = mime.MimeType.parse('text/html; foo="a/b"')
+    assert parsed.type == 'text' and parsed.subtype == 'html'
+    assert parsed.parameters['foo'] == 'a/b'
+
+
+@nose.tools.raises(ValueError)
+def test_mimetype_too_long():
+    """Overly long mime types are rejected."""
+
+    mime.MimeType.parse('text/plain; foo=' + 'a' * mime.MimeType.max_length)
+
+
+def test_mimetype_essence():
+    """ The essence of a mime type drops its parameters. """
+    mimetype = mime.MimeType.parse('application/json; charset=utf-8')
+
+    assert mimetype.essence is mime.MimeType.parse('application/json')
+    assert mimetype.essence.essence is mimetype.essence
@@ -1,7 +1,6 @@
-import decimal
-
 import eupheme.negotiation as negotiation
 import eupheme.mime as mime
+import eupheme.response as response
 
 # Mime types that we will be using for testing, from least to most specific.
 any_any = mime.MimeType('*', '*')
@@ -102,23 +101,170 @@ def test_assign_quality():
     # Test that all requested types are assigned the right priority, that of
     # the offered type that matches them best.
     match_text_html_1 = broker.closest_match(requested, text_html_1)
-    assert match_text_html_1.quality == decimal.Decimal('1')
+    assert match_text_html_1.quality == 1000
 
     match_text_html_2 = broker.closest_match(requested, text_html_2)
-    assert match_text_html_2.quality == decimal.Decimal('0.4')
+    assert match_text_html_2.quality == 400
 
     match_text_html_2 = broker.closest_match(requested, text_html_3)
-    assert match_text_html_2.quality == decimal.Decimal('0.7')
+    assert match_text_html_2.quality == 700
 
     match_text_html = broker.closest_match(requested, text_html)
-    assert match_text_html.quality == decimal.Decimal('0.7')
+    assert match_text_html.quality == 700
 
     match_text_plain = broker.closest_match(requested, text_plain)
-    assert match_text_plain.quality == decimal.Decimal('0.3')
+    assert match_text_plain.quality == 300
 
     match_image_jpeg = broker.closest_match(requested, image_jpeg)
-    assert match_image_jpeg.quality == decimal.Decimal('0.5')
+    assert match_image_jpeg.quality == 500
 
     # Test that the offered type of the highest client-assigned quality is
     # selected by the negotiation algorithm.
     assert broker.best_offer(requested, offered) == text_html_1
+
+
+class DummyRequest:
+    """Stands in for a request carrying the given Accept header."""
+
+    def __init__(self, accept):
+        self.environ = {'HTTP_ACCEPT': accept}
+        self.accept = {
+            mime.MimeType.parse(range_.strip()) for range_ in accept.split(',')
+        }
+        self.accept_charset = None
+
+
+def test_negotiation_cached():
+    """Negotiation outcomes are remembered per endpoint and headers."""
+
+    utf8 = mime.CharacterSet('utf-8')
+    broker = negotiation.Broker({utf8}, utf8, None, None)
+
+    def endpoint():
+        pass
+    endpoint.produces = {text_plain, mime.MimeType('text', 'html')}
+
+    request = DummyRequest('text/plain;q=0.5, text/html')
+    first = broker.negotiate(request, endpoint)
+    second = broker.negotiate(request, endpoint)
+
+    assert first is second
+    assert first.mimetype == mime.MimeType('text', 'html')
+    assert first.charset is utf8
+    assert first.key == (endpoint, 'text/plain;q=0.5, text/html', None, None)
+    assert 'Accept' in first.vary and 'Accept-Charset' in first.vary
+
+    # Without codings to offer, none is negotiated.
+    assert first.coding is None and 'Accept-Encoding' not in first.vary
+
+    # Replacing the mime types produced invalidates the outcome.
+    endpoint.produces = {text_plain}
+    assert broker.negotiate(request, endpoint).mimetype == text_plain
+
+
+def test_range_index():
+    """An indexed set of ranges finds the same closest matches."""
+
+    requested = [
+        mime.MimeType.parse('text/*;q=0.3'),
+        mime.MimeType.parse('text/html;q=0.7'),
+        mime.MimeType.parse('text/html;level=1'),
+        mime.MimeType.parse('text/html;level=2;q=0.4'),
+        mime.MimeType.parse('*/*;q=0.5'),
+    ]
+    index = negotiation.RangeIndex(requested)
+    broker = negotiation.Broker(None, None, None, None)
+
+    offers = [
+        mime.MimeType.parse('text/html;level=1'),
+        mime.MimeType.parse('text/html;level=2'),
+        mime.MimeType.parse('text/html;level=3'),
+        mime.MimeType.parse('text/plain'),
+        mime.MimeType.parse('image/jpeg'),
+    ]
+
+    assert index == set(requested)
+    for offer in offers:
+        assert index.closest(offer) is \
+            broker.closest_match(requested, offer)
+
+
+def test_range_index_no_match():
+    """An indexed set of ranges raises ValueError when nothing matches."""
+
+    index = negotiation.RangeIndex([text_plain_foo])
+
+    try:
+        index.closest(text_plain)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+
+
+def test_quality_zero_not_acceptable():
+    """Offers whose closest match has a quality of zero are turned down."""
+
+    text_html = mime.MimeType('text', 'html')
+    text_plain = mime.MimeType('text', 'plain')
+    requested = [
+        mime.MimeType.parse('text/html;q=0'),
+        mime.MimeType.parse('*/*;q=0.1'),
+    ]
+
+    assert negotiation.best_offer(requested, [text_html]) is None
+    assert negotiation.best_offer(requested, [text_html, text_plain]) is \
+        text_plain
+
+    # The same goes for character sets.
+    utf8 = mime.CharacterSet.parse('utf-8')
+    ascii = mime.CharacterSet.parse('ascii')
+    requested = [
+        mime.CharacterSet.parse('utf-8;q=0'),
+        mime.CharacterSet.parse('ascii;q=0.5'),
+    ]
+    assert negotiation.best_offer(requested, [utf8, ascii]) is ascii
+
+
+def test_content_coding():
+    """Content codings match by name, aliases resolved, or by wildcard."""
+
+    gzip = mime.ContentCoding('gzip')
+    requested = [
+        mime.ContentCoding.parse('x-gzip;q=0.5'),
+        mime.ContentCoding.parse('*;q=0.2'),
+    ]
+
+    assert negotiation.closest_match(requested, gzip).quality == 500
+    assert negotiation.best_offer(
+        requested, [mime.ContentCoding('br'), gzip]
+    ) is gzip
+
+
+def test_negotiate_coding():
+    """Content codings are negotiated with the same q semantics as charsets."""
+
+    gzip = mime.ContentCoding('gzip')
+    deflate = mime.ContentCoding('deflate')
+    identity = mime.ContentCoding('identity')
+    broker = negotiation.Broker(None, None, None, None,
+                                codings=[gzip, deflate, identity])
+
+    def accepted(header):
+        return negotiation.RangeIndex(
+            mime.ContentCoding.parse(coding.strip())
+            for coding in header.split(',')
+        )
+
+    assert broker.negotiate_coding(None) is identity
+    assert broker.negotiate_coding(accepted('deflate, gzip')) is gzip
+    assert broker.negotiate_coding(accepted('gzip;q=0.5, deflate')) is deflate
+    assert broker.negotiate_coding(accepted('gzip;q=0.5, *;q=0.7')) is deflate
+    assert broker.negotiate_coding(accepted('br, identity')) is identity
+
+    try:
+        broker.negotiate_coding(accepted('br, identity;q=0'))
+    except response.HttpNotAcceptableException:
+        pass
+    else:
+        assert False, 'HttpNotAcceptableException not raised'
@@ -0,0 +1,171 @@
+""" Testing module for eupheme.request.
+
+This file contains the testcases used to test how Request objects parse the
+WSGI environment they are created from.
+
+"""
+
+import io
+
+import nose
+
+import eupheme.mime as mime
+import eupheme.request as request
+import eupheme.response as response
+
+
+def environ(**headers):
+    """Builds a minimal WSGI environment with the headers 'headers'."""
+
+    env = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': '/',
+        'wsgi.input': io.BytesIO(),
+    }
+    env.update(headers)
+    return env
+
+
+def test_accept_parsed():
+    """Media ranges in the Accept header are parsed."""
+
+    req = request.Request(
+        environ(HTTP_ACCEPT='text/html, application/json;q=0.5'), None
+    )
+
+    assert req.accept == {
+        mime.MimeType('text', 'html'),
+        mime.MimeType.parse('application/json;q=0.5'),
+    }
+
+
+def test_accept_memoized():
+    """Equal Accept headers are parsed only once."""
+
+    header = 'text/plain;q=0.3, text/*;q=0.1'
+    first = request.Request(environ(HTTP_ACCEPT=header), None).accept
+    hits = request.Request.accept_cache.hits
+    second = request.Request(environ(HTTP_ACCEPT=header), None).accept
+
+    assert request.Request.accept_cache.hits == hits + 1
+    assert first is second
+
+
+def test_accept_charset_unknown():
+    """Unknown character sets are left out."""
+
+    req = request.Request(
+        environ(HTTP_ACCEPT_CHARSET='utf-8, no-such-charset'), None
+    )
+
+    assert len(req.accept_charset) == 1
+
+
+@nose.tools.raises(response.HttpBadRequestException)
+def test_accept_malformed():
+    """Malformed Accept headers are rejected, also when cached."""
+
+    for attempt in range(2):
+        try:
+            request.Request(
+                environ(HTTP_ACCEPT='text/html, a>b/c'), None
+            ).accept
+        except response.HttpBadRequestException:
+            if attempt == 1:
+                raise
+
+
+@nose.tools.raises(response.HttpBadRequestException)
+def test_accept_too_long():
+    """Accept headers beyond the length limit are rejected."""
+
+    header = ', '.join(['text/html'] * request.Request.max_header_length)
+    request.Request(environ(HTTP_ACCEPT=header), None).accept
+
+
+def test_parsed_lazily():
+    """Headers, cookies and the query string are parsed on first access."""
+
+    req = request.Request(
+        environ(
+            PATH_INFO='/search',
+            QUERY_STRING='q=nyaa',
+            HTTP_ACCEPT='text/html, a>b/c',
+            HTTP_COOKIE='name=value',
+            CONTENT_LENGTH='many',
+        ),
+        None
+    )
+
+    # The malformed Accept and Content-Length are only noticed when used.
+    assert req.path == '/search'
+    assert req.query == {'q': ['nyaa']}
+    assert req.cookies.get_cookie('name') == 'value'
+
+    try:
+        req.content_length
+    except response.HttpBadRequestException:
+        pass
+    else:
+        assert False, 'HttpBadRequestException not raised'
+
+
+def test_read_chunks():
+    """The entity is read in chunks, no further than its length."""
+
+    req = request.Request(environ(
+        CONTENT_LENGTH='10',
+        **{'wsgi.input': io.BytesIO(b'0123456789trailing')}
+    ), None)
+
+    assert list(req.read_chunks(4)) == [b'0123', b'4567', b'89']
+
+
+@nose.tools.raises(response.HttpRequestEntityTooLargeException)
+def test_read_chunks_too_large():
+    """Entities longer than allowed are rejected before reading."""
+
+    req = request.Request(environ(CONTENT_LENGTH='10'), None)
+    req.read_chunks(4, max_length=8)
+
+
+def test_accept_encoding_identity():
+    """The identity coding is acceptable unless excluded."""
+
+    req = request.Request(environ(HTTP_ACCEPT_ENCODING='x-gzip, br;q=0.5'),
+                          None)
+    names = {coding.name: coding.quality for coding in req.accept_encoding}
+    assert names == {'gzip': 1000, 'br': 500, 'identity': 1}
+
+    for header in ('gzip, identity;q=0', 'gzip, *;q=0'):
+        req = request.Request(environ(HTTP_ACCEPT_ENCODING=header), None)
+        identity = mime.ContentCoding('identity')
+        assert req.accept_encoding.closest(identity).quality == 0
+
+
+def test_etag_matches():
+    """Entity tags are compared weakly against If-None-Match."""
+
+    req = request.Request(environ(HTTP_IF_NONE_MATCH='"a", W/"b"'), None)
+    assert req.etag_matches('"a"')
+    assert req.etag_matches('"b"')
+    assert req.etag_matches('W/"a"')
+    assert not req.etag_matches('"c"')
+
+    req = request.Request(environ(HTTP_IF_NONE_MATCH='*'), None)
+    assert req.etag_matches('"c"')
+
+    assert not request.Request(environ(), None).etag_matches('"a"')
+
+
+def test_cache_control():
+    """Cache-Control directives are parsed, falling back on Pragma."""
+
+    req = request.Request(environ(
+        HTTP_CACHE_CONTROL='No-Cache, max-age="10"', HTTP_PRAGMA='no-cache'
+    ), None)
+    assert req.cache_control == {'no-cache': None, 'max-age': '10'}
+
+    req = request.Request(environ(HTTP_PRAGMA='no-cache'), None)
+    assert req.cache_control == {'no-cache': None}
+    assert request.Request(environ(), None).cache_control == {}
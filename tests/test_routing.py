@@ -0,0 +1,213 @@
+""" Testing module for eupheme.routing.
+
+This file contains the testcases used to test that the compiled routing table
+dispatches paths to the same routes a linear scan over all routes would.
+
+"""
+
+import re
+import uuid
+
+import nose
+
+import eupheme.response as response
+import eupheme.routing as routing
+
+
+def linear_match(patterns, path):
+    """Reference implementation trying every pattern in order."""
+
+    for pattern in patterns:
+        match = re.match(pattern, path)
+        if match:
+            return pattern, match.groups()
+    return None
+
+
+def test_split_literal():
+    """Static prefixes and literal routes are recognized."""
+
+    assert routing.split_literal('^/about$') == ('/about', True)
+    assert routing.split_literal('/about') == ('/about', False)
+    assert routing.split_literal(r'/users/(\d+)$') == ('/users/', False)
+    assert routing.split_literal(r'/a\.b$') == ('/a.b', True)
+    assert routing.split_literal(r'/a\Z') == ('/a', False)
+
+    # A quantified character is optional and therefore not in the prefix.
+    assert routing.split_literal('/items?$') == ('/item', False)
+
+    # A top level alternation has no common prefix at all.
+    assert routing.split_literal('/a|/b') == ('', False)
+
+
+def test_literal_route():
+    """Literal routes are looked up directly."""
+
+    routes = routing.RouteManager()
+    routes.add('^/about$', 'about')
+    routes.add('^/$', 'index')
+
+    assert routes.match('/about') == ('about', ())
+    assert routes.match('/') == ('index', ())
+
+
+@nose.tools.raises(response.HttpNotFoundException)
+def test_no_match():
+    """HttpNotFoundException is raised when no route matches."""
+
+    routes = routing.RouteManager()
+    routes.add('^/about$', 'about')
+    routes.match('/about/more')
+
+
+def test_insertion_order():
+    """The route added first takes precedence, whatever its kind."""
+
+    routes = routing.RouteManager()
+    routes.add(r'^/users/(\w+)$', 'any')
+    routes.add('^/users/me$', 'me')
+    routes.add(r'^/users/(\d+)$', 'numeric')
+
+    assert routes.match('/users/me') == ('any', ('me',))
+    assert routes.match('/users/12') == ('any', ('12',))
+
+    routes = routing.RouteManager()
+    routes.add('^/users/me$', 'me')
+    routes.add(r'^/users/(\d+)$', 'numeric')
+    routes.add(r'^/users/(\w+)$', 'any')
+
+    assert routes.match('/users/me') == ('me', ())
+    assert routes.match('/users/12') == ('numeric', ('12',))
+    assert routes.match('/users/bob') == ('any', ('bob',))
+
+
+def test_routes_added_after_match():
+    """Routes added after the table was compiled are taken into account."""
+
+    routes = routing.RouteManager()
+    routes.add('^/a$', 'a')
+    assert routes.match('/a') == ('a', ())
+
+    routes.add('^/b$', 'b')
+    assert routes.match('/b') == ('b', ())
+
+
+def test_same_as_linear_scan():
+    """The compiled table agrees with a linear scan over the patterns."""
+
+    patterns = [
+        '^/$',
+        '^/about$',
+        r'^/blog/(\d{4})/(\d{2})/([\w-]+)$',
+        r'^/blog/(\d{4})/$',
+        '^/blog/feed',
+        r'^/blog/(?P<slug>[\w-]+)$',
+        '(?i)^/CaseLess$',
+        r'^/(a|b)/(\1)$',
+        '^/static/(.*)$',
+        '/files?/(.*)',
+        '^/a|^/b',
+        r'^/api/v(\d)/users$',
+        r'^/api/v1/users/(\d+)$',
+        r'^/foo\Z',
+        '.*',
+    ]
+
+    routes = routing.RouteManager()
+    for pattern in patterns:
+        routes.add(pattern, pattern)
+    routes.freeze()
+
+    paths = [
+        '/', '/about', '/about/', '/blog/2014/05/hello-world', '/blog/2014/',
+        '/blog/feed.xml', '/blog/hello', '/caseless', '/a/a', '/a/b',
+        '/static/css/site.css', '/file/x', '/files/y', '/b', '/api/v1/users',
+        '/api/v1/users/12', '/nothing', '', '/about\n', '/foo', '/foo\n',
+    ]
+
+    for path in paths:
+        expected = linear_match(patterns, path)
+        assert routes.match(path) == expected, path
+
+
+def test_match_cache():
+    """Matches and misses are cached and counted per path."""
+
+    routes = routing.RouteManager(cache_size=2)
+    routes.add(r'^/users/(\d+)$', 'user')
+
+    assert routes.match('/users/1') == ('user', ('1',))
+    assert routes.match('/users/1') == ('user', ('1',))
+    assert routes.cache.hits == 1 and routes.cache.misses == 1
+
+    # Misses are remembered as well, and still raise.
+    for attempt in range(2):
+        try:
+            routes.match('/nowhere')
+        except response.HttpNotFoundException:
+            pass
+        else:
+            assert False, 'HttpNotFoundException not raised'
+    assert routes.cache.hits == 2 and routes.cache.misses == 2
+
+    # The least recently used path is evicted first.
+    routes.match('/users/2')
+    assert '/users/1' not in routes.cache
+    assert '/nowhere' in routes.cache
+
+
+def test_match_cache_invalidated():
+    """Adding a route invalidates the cached results."""
+
+    routes = routing.RouteManager(cache_size=8)
+    routes.add('^/a$', 'a')
+
+    try:
+        routes.match('/b')
+    except response.HttpNotFoundException:
+        pass
+
+    routes.add('^/b$', 'b')
+    assert routes.match('/b') == ('b', ())
+
+
+def test_typed_segments():
+    """Typed segments are converted before reaching the endpoint."""
+
+    routes = routing.RouteManager()
+    routes.add('^/items/{id:int}$', 'item')
+    routes.add('^/items/{slug:str}$', 'slug')
+    routes.add('^/tokens/{token:uuid}/{rest:path}$', 'token')
+
+    assert routes.match('/items/42') == ('item', (42,))
+    assert routes.match('/items/answer') == ('slug', ('answer',))
+
+    token = '12345678-1234-5678-1234-567812345678'
+    assert routes.match('/tokens/{0}/a/b'.format(token)) == \
+        ('token', (uuid.UUID(token), 'a/b'))
+
+
+def test_typed_segments_positions():
+    """Typed segments mix with ordinary subpatterns."""
+
+    routes = routing.RouteManager()
+    routes.add(r'^/(\w+)/{year:int}/(\d+)$', 'archive')
+
+    assert routes.match('/blog/2014/05') == ('archive', ('blog', 2014, '05'))
+
+
+@nose.tools.raises(response.HttpNotFoundException)
+def test_typed_segment_mismatch():
+    """A segment not matching its type is not found."""
+
+    routes = routing.RouteManager()
+    routes.add('^/items/{id:int}$', 'item')
+    routes.match('/items/answer')
+
+
+@nose.tools.raises(ValueError)
+def test_unknown_converter():
+    """Unknown converters are rejected when the route is added."""
+
+    routes = routing.RouteManager()
+    routes.add('^/items/{id:complex}$', 'item')
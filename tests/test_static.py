@@ -0,0 +1,250 @@
+""" Testing module for eupheme.static.
+
+This file contains the testcases used to test that static files are served
+with validators, answered with 304 when unchanged and served in part when a
+byte range is requested.
+
+"""
+
+import gzip
+import os
+import tempfile
+
+import eupheme.application as application
+import eupheme.static as static
+import tests.test_application as test_application
+
+
+def make_app(root):
+    """Creates an application serving the files in 'root' on /static."""
+
+    app = application.Application()
+    app.routes.add('^/static/{path:path}$', static.StaticFiles(root))
+    return app
+
+
+def fetch(app, path, method='GET', **headers):
+    """
+    Requests 'path' from the application 'app' with the method 'method' and
+    the environment variables 'headers', and returns the status, headers and
+    body of the response.
+    """
+
+    status, headers, chunks = test_application.serve(
+        app, test_application.environ(path, REQUEST_METHOD=method, **headers)
+    )
+    return status, headers, b''.join(chunks)
+
+
+# The temporary directory of the test being run, removed once it is done.
+directory = None
+
+
+def setup_function(function):
+    global directory
+    directory = tempfile.TemporaryDirectory()
+
+
+def teardown_function(function):
+    directory.cleanup()
+
+
+def setup_root():
+    """
+    Creates a directory holding a text file within the temporary directory
+    and returns its path.
+    """
+
+    root = os.path.join(directory.name, 'root')
+    os.mkdir(root)
+    with open(os.path.join(root, 'hello.txt'), 'wb') as file:
+        file.write(b'0123456789')
+    return root
+
+
+def test_serve_file():
+    """Files are served whole, with their type and validators."""
+
+    app = make_app(setup_root())
+    status, headers, body = fetch(app, '/static/hello.txt')
+
+    assert status == '200 OK'
+    assert body == b'0123456789'
+    assert headers['Content-Type'] == 'text/plain; charset=utf-8'
+    assert headers['Content-Length'] == '10'
+    assert headers['ETag'].startswith('"')
+    assert 'Last-Modified' in headers and 'Vary' not in headers
+
+    status, head, body = fetch(app, '/static/hello.txt', method='HEAD')
+    assert status == '200 OK' and body == b''
+    assert head['Content-Length'] == '10'
+
+
+def test_file_wrapper():
+    """Whole files are handed to the server's file wrapper."""
+
+    wrapped = []
+
+    def file_wrapper(file, block_size):
+        wrapped.append(file)
+        return iter(lambda: file.read(block_size), b'')
+
+    app = make_app(setup_root())
+    status, headers, body = fetch(app, '/static/hello.txt', **{
+        'wsgi.file_wrapper': file_wrapper
+    })
+
+    assert body == b'0123456789'
+    assert len(wrapped) == 1 and hasattr(wrapped[0], 'fileno')
+    wrapped[0].close()
+
+
+def test_not_modified():
+    """Clients with an up to date copy are answered with 304."""
+
+    app = make_app(setup_root())
+    status, headers, body = fetch(app, '/static/hello.txt')
+
+    for conditional in ({'HTTP_IF_NONE_MATCH': headers['ETag']},
+                        {'HTTP_IF_NONE_MATCH': 'W/' + headers['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': headers['Last-Modified']}):
+        status, cached, body = fetch(app, '/static/hello.txt', **conditional)
+        assert status == '304 Not Modified', conditional
+        assert body == b'' and cached['ETag'] == headers['ETag']
+
+    status, headers, body = fetch(app, '/static/hello.txt',
+                                  HTTP_IF_NONE_MATCH='"other"')
+    assert status == '200 OK'
+
+
+def test_modified_file():
+    """Changed files get new validators."""
+
+    root = setup_root()
+    app = make_app(root)
+    status, headers, body = fetch(app, '/static/hello.txt')
+
+    with open(os.path.join(root, 'hello.txt'), 'wb') as file:
+        file.write(b'changed')
+
+    status, changed, body = fetch(app, '/static/hello.txt',
+                                  HTTP_IF_NONE_MATCH=headers['ETag'])
+    assert status == '200 OK' and body == b'changed'
+    assert changed['ETag'] != headers['ETag']
+
+
+def test_range():
+    """Byte ranges are served as partial content."""
+
+    app = make_app(setup_root())
+
+    for requested, content_range, expected in (
+            ('bytes=2-5', 'bytes 2-5/10', b'2345'),
+            ('bytes=7-', 'bytes 7-9/10', b'789'),
+            ('bytes=-3', 'bytes 7-9/10', b'789'),
+            ('bytes=8-100', 'bytes 8-9/10', b'89')):
+        status, headers, body = fetch(app, '/static/hello.txt',
+                                      HTTP_RANGE=requested)
+
+        assert status == '206 Partial Content', requested
+        assert headers['Content-Range'] == content_range
+        assert headers['Content-Length'] == str(len(expected))
+        assert body == expected
+
+    # Multiple ranges and stale copies are answered with the whole file.
+    for conditional in ({'HTTP_RANGE': 'bytes=0-1,4-5'},
+                        {'HTTP_RANGE': 'bytes=0-1', 'HTTP_IF_RANGE': '"x"'}):
+        status, headers, body = fetch(app, '/static/hello.txt', **conditional)
+        assert status == '200 OK' and body == b'0123456789'
+
+    status, headers, body = fetch(app, '/static/hello.txt',
+                                  HTTP_RANGE='bytes=10-')
+    assert status == '416 Requested Range Not Satisfiable'
+    assert headers['Content-Range'] == 'bytes */10'
+
+
+def test_outside_root():
+    """Paths leading outside the root directory are not found."""
+
+    root = setup_root()
+    with open(os.path.join(root, '..', 'secret.txt'), 'wb') as file:
+        file.write(b'secret')
+
+    app = make_app(root)
+    for path in ('/static/../secret.txt', '/static/missing.txt',
+                 '/static/.'):
+        status, headers, body = fetch(app, path)
+        assert status == '404 Not Found', path
+
+
+def setup_variants():
+    """
+    Creates a directory holding a compressible style sheet and an image, and
+    returns its path along with that of a directory for variants.
+    """
+
+    root = setup_root()
+    with open(os.path.join(root, 'site.css'), 'wb') as file:
+        file.write(b'body { color: black; }\n' * 100)
+    with open(os.path.join(root, 'logo.png'), 'wb') as file:
+        file.write(b'\x89PNG' * 100)
+    return root, os.path.join(root, '.variants')
+
+
+def test_precompressed():
+    """Compressible files are served gzipped to clients accepting it."""
+
+    root, variants = setup_variants()
+    app = application.Application()
+    app.routes.add('^/static/{path:path}$',
+                   static.StaticFiles(root, variants=variants))
+
+    status, headers, body = fetch(app, '/static/site.css',
+                                  HTTP_ACCEPT_ENCODING='gzip, deflate')
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert headers['Content-Length'] == str(len(body))
+    assert gzip.decompress(body) == b'body { color: black; }\n' * 100
+    assert os.path.exists(os.path.join(variants, 'site.css.gz'))
+
+    # The variant has an entity tag of its own.
+    status, identity, body = fetch(app, '/static/site.css')
+    assert 'Content-Encoding' not in identity
+    assert identity['Vary'] == 'Accept-Encoding'
+    assert identity['ETag'] != headers['ETag']
+    assert body == b'body { color: black; }\n' * 100
+
+    status, headers, body = fetch(app, '/static/site.css',
+                                  HTTP_ACCEPT_ENCODING='gzip;q=0, br')
+    assert 'Content-Encoding' not in headers
+
+    # Neither images nor small text files are compressed.
+    for path in ('/static/logo.png', '/static/hello.txt'):
+        status, headers, body = fetch(app, path, HTTP_ACCEPT_ENCODING='gzip')
+        assert 'Content-Encoding' not in headers and 'Vary' not in headers
+
+
+def test_precompress():
+    """Variants can be built up front, and are rebuilt when out of date."""
+
+    root, variants = setup_variants()
+
+    # Files that are not served are skipped rather than failing the lot.
+    os.symlink(os.path.join(root, 'missing.css'),
+               os.path.join(root, 'dangling.css'))
+    os.mkfifo(os.path.join(root, 'pipe.css'))
+
+    files = static.StaticFiles(root, variants=variants)
+    files.precompress()
+
+    assert sorted(os.listdir(variants)) == ['site.css.gz']
+
+    with open(os.path.join(root, 'site.css'), 'wb') as file:
+        file.write(b'p { margin: 0; }\n' * 100)
+    os.utime(os.path.join(root, 'site.css'), ns=(10 ** 18, 10 ** 18))
+
+    app = application.Application()
+    app.routes.add('^/static/{path:path}$', files)
+    status, headers, body = fetch(app, '/static/site.css',
+                                  HTTP_ACCEPT_ENCODING='gzip')
+    assert gzip.decompress(body) == b'p { margin: 0; }\n' * 100